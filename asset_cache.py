@@ -0,0 +1,177 @@
+import os
+from collections import OrderedDict
+
+import pygame as pg
+
+from baked_assets import baked_assets, image_key, folder_key, tileset_key
+from shared import get_screen
+from preload import preloader
+
+
+def surface_size_in_bytes(surface):
+    return surface.get_width() * surface.get_height() * surface.get_bytesize()
+
+
+class SurfaceCache:
+    # least recently used entries are evicted once the cached surfaces take more than max_bytes
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, load):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key][0]
+
+        self.misses += 1
+        value = load()
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        if key in self.entries:
+            self.used_bytes -= self.entries.pop(key)[1]
+
+        size = self.size_of(value)
+        self.entries[key] = (value, size)
+        self.used_bytes += size
+        self.evict()
+
+    def evict(self):
+        # always keep the newest entry, even if it alone is over the limit
+        while self.used_bytes > self.max_bytes and len(self.entries) > 1:
+            _, (_, size) = self.entries.popitem(last=False)
+            self.used_bytes -= size
+            self.evictions += 1
+
+    def size_of(self, value):
+        if isinstance(value, pg.Surface):
+            return surface_size_in_bytes(value)
+        return sum(surface_size_in_bytes(surface) for surface in value)
+
+    def clear(self):
+        self.entries.clear()
+        self.used_bytes = 0
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "used_bytes": self.used_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hit_rate(), 3),
+        }
+
+
+def load_surface(path):
+    image = preloader.take(path)
+    if image is None:
+        with preloader.timed("load " + path):
+            image = pg.image.load(path)
+    get_screen()
+    return image.convert_alpha()
+
+
+def load_folder_frames(path):
+    images = []
+    for filename in os.listdir(path):
+        img_path = os.path.join(path, filename)
+        if os.path.isfile(img_path):
+            images.append(load_surface(img_path))
+    return images
+
+
+def slice_tileset(image, tile_width, tile_height):
+    image_width, image_height = image.get_size()
+
+    tiles = []
+    for y in range(0, image_height, tile_height):
+        for x in range(0, image_width, tile_width):
+            tiles.append(image.subsurface((x, y, tile_width, tile_height)).convert_alpha())
+    return tiles
+
+
+class AssetRegistry(SurfaceCache):
+    def __init__(self, max_bytes=192 * 1024 * 1024):
+        super().__init__(max_bytes)
+
+    def image(self, path):
+        def load():
+            baked = baked_assets.frames(image_key(path))
+            return baked[0] if baked else load_surface(path)
+
+        return self.get(("image", path), load)
+
+    def folder(self, path):
+        def load():
+            return baked_assets.frames(folder_key(path)) or load_folder_frames(path)
+
+        # callers get their own list, the surfaces themselves are shared
+        return list(self.get(("folder", path), load))
+
+    def tileset(self, path, tile_width, tile_height):
+        def load():
+            baked = baked_assets.frames(tileset_key(path, tile_width, tile_height))
+            return baked or slice_tileset(load_surface(path), tile_width, tile_height)
+
+        return list(self.get(("tileset", path, tile_width, tile_height), load))
+
+
+class TransformCache(SurfaceCache):
+    # prepared (scaled, flipped, rotated) variants of source frames, shared by every Animated object
+    def __init__(self, max_bytes=96 * 1024 * 1024):
+        super().__init__(max_bytes)
+
+    def variant(self, frame, size, flipped_x=False, flipped_y=False, rotate=0):
+        size = (int(size[0]), int(size[1]))
+        flipped_x = bool(flipped_x)
+        flipped_y = bool(flipped_y)
+        rotate = rotate % 360
+
+        # baked frames usually already have the requested size
+        if size == frame.get_size() and not flipped_x and not flipped_y and not rotate:
+            return frame
+
+        def build():
+            image = pg.transform.scale(frame, size)
+            if flipped_x or flipped_y:
+                image = pg.transform.flip(image, flipped_x, flipped_y)
+            if rotate:
+                image = pg.transform.rotate(image, rotate)
+            return image
+
+        # the key holds a reference to the frame, so its id can't be reused by another surface
+        return self.get((frame, size, flipped_x, flipped_y, rotate), build)
+
+
+class TextCache(SurfaceCache):
+    # rendered strings, so text that reads the same as last frame isn't rasterized again
+    def __init__(self, max_bytes=4 * 1024 * 1024):
+        super().__init__(max_bytes)
+
+    def render(self, font, text, color, antialias=True):
+        return self.get((font, text, color, antialias), lambda: font.render(text, antialias, color))
+
+
+asset_registry = AssetRegistry()
+transform_cache = TransformCache()
+text_cache = TextCache()
+
+
+def cache_stats():
+    return {
+        "assets": asset_registry.stats(),
+        "transforms": transform_cache.stats(),
+        "text": text_cache.stats(),
+    }
@@ -0,0 +1,204 @@
+import json
+import mmap
+import os
+
+import pygame as pg
+
+BAKED_DIR = "assets/baked"
+INDEX_FILE = "index.json"
+ATLAS_MAX_WIDTH = 2048
+ATLAS_MAX_HEIGHT = 2048
+
+
+def image_key(path):
+    return "image:" + path
+
+
+def folder_key(path):
+    return "folder:" + path
+
+
+def tileset_key(path, tile_width, tile_height):
+    return "tileset:" + path + ":" + str(tile_width) + "x" + str(tile_height)
+
+
+def bake_specs():
+    from shared import WALL_SIZE, CHARACTER_SIZE
+    from ui import cell_width, cell_height
+
+    character_size = int(CHARACTER_SIZE * 1.7)
+    mini_map_dir = "assets/ui/1 Sprites/Paper UI Pack/Paper UI/Plain/5 Mini Map/"
+    animations_dir = "assets/items_and_traps_animations/"
+
+    # (kind, path, tile size for tilesets, size the game draws the frames at - None keeps the source size)
+    return [
+        ("tileset", "assets/dungeon_tileset.png", (16, 16), (WALL_SIZE, WALL_SIZE)),
+        ("tileset", "assets/overworld_tileset.png", (16, 16), (WALL_SIZE - 5, WALL_SIZE - 5)),
+        ("tileset", "assets/player_character/player.png", (32, 32), (character_size, character_size)),
+        ("tileset", "assets/skeleton_enemy/skeleton_enemy.png", (32, 32), (character_size, character_size)),
+        ("tileset", "assets/food.png", (16, 16), (int(WALL_SIZE * 0.7), int(WALL_SIZE * 0.7))),
+        ("tileset", "assets/coin.png", (13, 13), (30, 30)),
+        ("folder", "assets/skeleton_scythe_enemy", None, (int(CHARACTER_SIZE * 0.92), int(CHARACTER_SIZE * 0.92))),
+        ("folder", "assets/merchant", None, (int(CHARACTER_SIZE * 0.96), int(CHARACTER_SIZE * 0.96))),
+        ("folder", animations_dir + "flag", None, (WALL_SIZE, WALL_SIZE)),
+        ("folder", animations_dir + "candlestick_1", None, (WALL_SIZE, WALL_SIZE)),
+        ("folder", animations_dir + "candlestick_2", None, (WALL_SIZE, WALL_SIZE)),
+        ("folder", animations_dir + "torch_front", None, (WALL_SIZE, WALL_SIZE)),
+        ("folder", animations_dir + "torch_sideways", None, (WALL_SIZE, WALL_SIZE)),
+        ("folder", animations_dir + "keys/silver", None, (int(WALL_SIZE * 0.8), int(WALL_SIZE * 0.8))),
+        ("folder", animations_dir + "keys/silver_resized", None, (30, 22)),
+        ("folder", animations_dir + "chest/normal", None, (int(WALL_SIZE * 0.8), int(WALL_SIZE * 0.8))),
+        ("folder", animations_dir + "chest/open", None, (int(WALL_SIZE * 0.8), int(WALL_SIZE * 0.8))),
+        ("folder", animations_dir + "peaks", None, (int(WALL_SIZE * 0.8), int(WALL_SIZE * 0.8))),
+        ("folder", animations_dir + "flamethrower_front", None, None),
+        ("folder", animations_dir + "flamethrower_sideways", None, None),
+        ("folder", animations_dir + "arrow_horizontal", None, None),
+        ("folder", animations_dir + "arrow_vertical", None, None),
+        ("folder", animations_dir + "coin", None, None),
+        ("folder", "assets/effects/dash", None, None),
+        ("folder", "assets/effects/step", None, None),
+        ("folder", "assets/effects/spotted", None, None),
+        ("folder", "assets/effects/explosion", None, None),
+        ("folder", "assets/effects/slash_attack", None, None),
+        ("image", "assets/heart.png", None, (30, 28)),
+        ("image", "assets/x.png", None, None),
+        ("image", "assets/arrow_horizontal.png", None, None),
+        ("image", "assets/arrow_vertical.png", None, None),
+        ("image", mini_map_dir + "darkened.png", None, None),
+        ("image", mini_map_dir + "cell.png", None, (cell_width, cell_height)),
+        ("image", mini_map_dir + "cell_visited.png", None, (cell_width, cell_height)),
+        ("image", mini_map_dir + "cell_current.png", None, (cell_width, cell_height)),
+        ("image", mini_map_dir + "cell_start.png", None, (cell_width, cell_height)),
+    ]
+
+
+class AtlasPacker:
+    # simple shelf packer, starts a new atlas once the current one is full
+    def __init__(self):
+        self.atlases = []
+        self.new_atlas()
+
+    def new_atlas(self):
+        self.placements = []
+        self.atlases.append(self.placements)
+        self.cursor_x = 0
+        self.cursor_y = 0
+        self.shelf_height = 0
+
+    def place(self, frame):
+        width, height = frame.get_size()
+
+        if self.cursor_x + width > ATLAS_MAX_WIDTH:
+            self.cursor_x = 0
+            self.cursor_y += self.shelf_height
+            self.shelf_height = 0
+
+        if self.cursor_y + height > ATLAS_MAX_HEIGHT and self.placements:
+            self.new_atlas()
+
+        rect = (self.cursor_x, self.cursor_y, width, height)
+        self.placements.append((frame, rect))
+        self.cursor_x += width
+        self.shelf_height = max(self.shelf_height, height)
+
+        return len(self.atlases) - 1, rect
+
+
+def bake(output_dir=BAKED_DIR):
+    from asset_cache import load_surface, load_folder_frames, slice_tileset
+
+    packer = AtlasPacker()
+    entries = {}
+
+    for kind, path, tile_size, frame_size in bake_specs():
+        if not os.path.exists(path):
+            print("Skipping missing asset", path)
+            continue
+
+        if kind == "tileset":
+            frames = slice_tileset(load_surface(path), tile_size[0], tile_size[1])
+            key = tileset_key(path, tile_size[0], tile_size[1])
+        elif kind == "folder":
+            frames = load_folder_frames(path)
+            key = folder_key(path)
+        else:
+            frames = [load_surface(path)]
+            key = image_key(path)
+
+        if frame_size:
+            frames = [pg.transform.scale(frame, frame_size) for frame in frames]
+
+        placed = [packer.place(frame) for frame in frames]
+        entries[key] = {"atlas": [atlas for atlas, _ in placed], "frames": [rect for _, rect in placed]}
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    atlases = []
+    for i, placements in enumerate(packer.atlases):
+        width = max((x + w for _, (x, y, w, h) in placements), default=1)
+        height = max((y + h for _, (x, y, w, h) in placements), default=1)
+
+        atlas = pg.Surface((width, height), pg.SRCALPHA)
+        atlas.blits([(frame, rect[:2]) for frame, rect in placements], False)
+
+        filename = "atlas_" + str(i) + ".raw"
+        with open(os.path.join(output_dir, filename), "wb") as f:
+            f.write(pg.image.tostring(atlas, "RGBA"))
+        atlases.append({"file": filename, "size": [width, height]})
+
+    with open(os.path.join(output_dir, INDEX_FILE), "w") as f:
+        json.dump({"atlases": atlases, "entries": entries}, f)
+
+    print("Baked", len(entries), "assets into", len(atlases), "atlases in", output_dir)
+
+
+class BakedAssets:
+    def __init__(self, directory=BAKED_DIR):
+        self.directory = directory
+        self.index = None
+        self.atlases = {}
+        self.sources = None
+
+    def load_index(self):
+        if self.index is None:
+            index_path = os.path.join(self.directory, INDEX_FILE)
+            if os.path.isfile(index_path):
+                with open(index_path) as f:
+                    self.index = json.load(f)
+            else:
+                self.index = {"atlases": [], "entries": {}}
+        return self.index
+
+    def atlas(self, i):
+        from shared import get_screen
+
+        if i not in self.atlases:
+            info = self.load_index()["atlases"][i]
+            with open(os.path.join(self.directory, info["file"]), "rb") as f:
+                pixels = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+            # the raw pixels are wrapped without decoding, converting them once per atlas
+            # is still much cheaper than blitting an RGBA surface every frame
+            raw_atlas = pg.image.frombuffer(pixels, info["size"], "RGBA")
+            get_screen()
+            self.atlases[i] = raw_atlas.convert_alpha()
+        return self.atlases[i]
+
+    def is_baked(self, path):
+        if self.sources is None:
+            self.sources = {key.split(":")[1] for key in self.load_index()["entries"]}
+        return path in self.sources
+
+    def frames(self, key):
+        entry = self.load_index()["entries"].get(key)
+        if entry is None:
+            return None
+
+        return [self.atlas(atlas).subsurface(rect) for atlas, rect in zip(entry["atlas"], entry["frames"])]
+
+
+baked_assets = BakedAssets()
+
+
+if __name__ == "__main__":
+    bake()
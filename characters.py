@@ -1,18 +1,42 @@
 import math
-import random
 
 import pygame as pg
 
 from items import Item, Key
-from shared import WALL_SIZE, CHARACTER_SIZE, visuals, font, screen, walls, font_s, characters
-from utility import Animated, load_images_from_folder, Visual, NotificationVisual, ActionObject, Collider, load_tileset
+from shared import WALL_SIZE, CHARACTER_SIZE, visuals, get_font, wall_grid, get_small_font, characters, get_ticks
+from utility import Animated, load_images_from_folder, Visual, NotificationVisual, ActionObject, Collider, load_tileset, \
+    load_image, TextBlock
+from asset_cache import text_cache
+from preload import preloader
+from debug_overlay import debug_overlay
+from renderer import draw_queue
+from rng import population_random, ai_random, loot_random
+from timestep import interpolation
 
-player_images = load_tileset("assets/player_character/player.png", 32, 32)
-player_upgrades_images = load_tileset("assets/food.png", 16, 16)[0:35]
+preloader.declare("common", "tileset", "assets/player_character/player.png")
+preloader.declare("common", "folder", "assets/effects/dash", "assets/effects/step")
+preloader.declare("underworld", "tileset", "assets/skeleton_enemy/skeleton_enemy.png", "assets/food.png")
+preloader.declare("underworld", "folder", "assets/skeleton_scythe_enemy", "assets/merchant", "assets/effects/spotted",
+                  "assets/effects/explosion", "assets/effects/slash_attack")
+preloader.declare("underworld", "image", "assets/x.png")
+
+
+def get_player_images():
+    return load_tileset("assets/player_character/player.png", 32, 32)
+
+
+def get_player_upgrades_images():
+    return load_tileset("assets/food.png", 16, 16)[0:35]
+
+
+def get_skeleton_enemy_images():
+    return load_tileset("assets/skeleton_enemy/skeleton_enemy.png", 32, 32)
 
-skeleton_enemy_images = load_tileset("assets/skeleton_enemy/skeleton_enemy.png", 32, 32)
 
 class Character(pg.sprite.Sprite, Animated):
+    # refiled in the render index as it moves
+    moves = True
+
     def __init__(self, x, y, images, size):
         super().__init__()
         self.health = 0
@@ -20,7 +44,7 @@ class Character(pg.sprite.Sprite, Animated):
         self.default_size = size
 
         Animated.__init__(self, images, (self.default_size, self.default_size), 150)
-        self.last_attack_time = pg.time.get_ticks()
+        self.last_attack_time = get_ticks()
         self.attack_size = self.default_size
         self.attack_cooldown = 0
         self.rect = self.image.get_rect(topleft=(x + CHARACTER_SIZE // 2, y + CHARACTER_SIZE // 2))
@@ -99,10 +123,10 @@ class Character(pg.sprite.Sprite, Animated):
             self.flipped_x = False
             self.animate()
 
-    def update(self, camera, *args, **kwargs):
+    def update(self, *args, **kwargs):
         self.animate_new_frame()
-        self.movement_collider.update(self.rect, camera)
-        self.damage_collider.update(self.rect, camera)
+        self.movement_collider.update(self.rect, self)
+        self.damage_collider.update(self.rect, self)
 
     def change_images(self, images):
         self.images = images
@@ -187,11 +211,7 @@ class Character(pg.sprite.Sprite, Animated):
         if dx == 0 and dy == 0:
             self.friction = self.default_friction
 
-        is_collision, is_collision_along_x, is_collision_along_y = False, False, False
-        for obj in walls:
-            if obj.rect.colliderect(new_rect) and obj != self:
-                is_collision = True
-                break
+        is_collision, is_collision_along_x, is_collision_along_y = wall_grid.collides(new_rect), False, False
 
         if not is_collision:
             self.rect.x += dx
@@ -201,8 +221,8 @@ class Character(pg.sprite.Sprite, Animated):
             new_x_rect = self.movement_collider.collision_rect.move(dx, 0)
             new_y_rect = self.movement_collider.collision_rect.move(0, dy)
 
-            is_collision_along_x = any(obj.rect.colliderect(new_x_rect) and obj != self for obj in walls)
-            is_collision_along_y = any(obj.rect.colliderect(new_y_rect) and obj != self for obj in walls)
+            is_collision_along_x = wall_grid.collides(new_x_rect)
+            is_collision_along_y = wall_grid.collides(new_y_rect)
 
             if not is_collision_along_x:
                 self.rect.x += dx
@@ -214,10 +234,10 @@ class Character(pg.sprite.Sprite, Animated):
 
 class SlashAttacker(Character):
     def slash_attack(self, direction, scale):
-        if pg.time.get_ticks() - self.last_attack_time < self.attack_cooldown:
+        if get_ticks() - self.last_attack_time < self.attack_cooldown:
             return
 
-        self.last_attack_time = pg.time.get_ticks()
+        self.last_attack_time = get_ticks()
 
         size = self.attack_size
         if direction[1] == 1:
@@ -241,7 +261,7 @@ class SlashAttacker(Character):
         attack = {
             'dim': dim,
             'dest': dest,
-            'start_time': pg.time.get_ticks(),
+            'start_time': get_ticks(),
             'duration': 150,
             'flipped_x': direction[0] == -1 or direction[1] == -1,
             'flipped_y': (direction[0] == 0 and direction[1] != -1),
@@ -253,17 +273,18 @@ class SlashAttacker(Character):
 
 class Player(SlashAttacker):
     def __init__(self, start_x, start_y):
+        player_images = get_player_images()
         Character.__init__(self, start_x, start_y, player_images[0:4], CHARACTER_SIZE * 1.7)
         self.full_health = 12
         self.speed = 20
 
-        self.last_dash_time = pg.time.get_ticks()
+        self.last_dash_time = get_ticks()
         self.dash_cooldown = 200
         self.dash_frame_duration = 80
 
         self.dash_animation_images = load_images_from_folder("assets/effects/dash")
         self.move_animation_images = load_images_from_folder("assets/effects/step")
-        self.last_move_animation = pg.time.get_ticks()
+        self.last_move_animation = get_ticks()
 
         self.idle_images = [[player_images[200]], [player_images[210]], [player_images[220]], [player_images[230]]]
         self.walking_images = [player_images[10:18], player_images[20:28], player_images[30:38], player_images[40:48]]
@@ -272,7 +293,7 @@ class Player(SlashAttacker):
         self.death_images = [player_images[150:158]]
 
         self.harm_animation_duration = 150
-        self.harm_animation_start_time = pg.time.get_ticks()
+        self.harm_animation_start_time = get_ticks()
         self.max_flash_count = 11
         self.flash_count = self.max_flash_count
 
@@ -295,11 +316,11 @@ class Player(SlashAttacker):
         self.change_images(self.idle_images[self.get_direction_index(self.move_direction)])
         self.mode = "idle"
 
-    def update(self, camera, *args, **kwargs):
+    def update(self, *args, **kwargs):
         if self.mode == "dead" and self.cur_frame == self.last_frame:
             return
 
-        super().update(camera)
+        super().update()
 
         if self.health <= 0 and self.mode != "dead":
             self.change_images(self.death_images[0])
@@ -313,7 +334,7 @@ class Player(SlashAttacker):
             self.stop_attacking()
 
         if self.flash_count < self.max_flash_count:
-            diff = pg.time.get_ticks() - self.harm_animation_start_time
+            diff = get_ticks() - self.harm_animation_start_time
 
             if self.flash_count % 2 == 0 and diff < self.harm_animation_duration:
                 self.image = pg.transform.scale(self.image, (0, 0))
@@ -321,7 +342,7 @@ class Player(SlashAttacker):
             elif diff > self.harm_animation_duration:
                 self.image = pg.transform.scale(self.image, (self.default_size, self.default_size))
                 self.flash_count += 1
-                self.harm_animation_start_time = pg.time.get_ticks()
+                self.harm_animation_start_time = get_ticks()
 
     def take_damage(self, damage, enemy=None):
         if self.mode == "dead" or self.mode == "dashing":
@@ -330,7 +351,7 @@ class Player(SlashAttacker):
         super().take_damage(damage, enemy)
 
         if self.health > 0:
-            self.harm_animation_start_time = pg.time.get_ticks()
+            self.harm_animation_start_time = get_ticks()
             self.flash_count = 0
 
         return True
@@ -349,7 +370,7 @@ class Player(SlashAttacker):
         self.change_images(self.idle_images[self.get_direction_index(self.move_direction)])
         self.mode = "idle"
         self.flip_model_on_move(1 if self.flipped_x else 0)
-        self.last_dash_time = pg.time.get_ticks()
+        self.last_dash_time = get_ticks()
         self.frame_duration = self.normal_frame_duration
 
     def update_dash(self):
@@ -360,11 +381,11 @@ class Player(SlashAttacker):
                 self.stop_dash()
 
     def add_walking_effect(self):
-        if pg.time.get_ticks() - self.last_move_animation > 220:
+        if get_ticks() - self.last_move_animation > 220:
             visuals.add(Visual(self.move_animation_images,
                                self.rect.move(-25 * self.move_direction[0], 10 - 40 * self.move_direction[1]).inflate(
-                                   -90, -90), pg.time.get_ticks(), 250))
-            self.last_move_animation = pg.time.get_ticks()
+                                   -90, -90), get_ticks(), 250))
+            self.last_move_animation = get_ticks()
 
     def move_player(self, dx, dy, ignore_dash_check=False):
         if (self.mode == "dead") or (self.is_dashing() and not ignore_dash_check) or \
@@ -386,10 +407,10 @@ class Player(SlashAttacker):
             self.add_walking_effect()
 
     def dash(self):
-        if self.mode == "dashing" or pg.time.get_ticks() - self.last_dash_time < self.dash_cooldown:
+        if self.mode == "dashing" or get_ticks() - self.last_dash_time < self.dash_cooldown:
             return
 
-        self.last_dash_time = pg.time.get_ticks()
+        self.last_dash_time = get_ticks()
         self.mode = "dashing"
         self.frame_duration = self.dash_frame_duration
 
@@ -397,7 +418,7 @@ class Player(SlashAttacker):
         self.change_images(self.dashing_images[0])
 
         dash_rotation = 90 if self.move_direction[1] < 0 else -90 if self.move_direction[1] > 0 else 0
-        visuals.add(Visual(self.dash_animation_images, self.damage_collider.collision_rect.copy(), pg.time.get_ticks(), 200, not self.flipped_x, rotate=dash_rotation))
+        visuals.add(Visual(self.dash_animation_images, self.damage_collider.collision_rect.copy(), get_ticks(), 200, not self.flipped_x, rotate=dash_rotation))
 
     def add_item(self, item):
         if isinstance(item, Key):
@@ -424,9 +445,9 @@ class Enemy(Character):
         self.full_health = 100
         self.last_known_player_position = None
         self.roam_position = None
-        self.last_roam_time = pg.time.get_ticks()
-        self.roam_wait_time = random.randint(1500, 2500)
-        self.last_turn_around_animation_time = pg.time.get_ticks()
+        self.last_roam_time = get_ticks()
+        self.roam_wait_time = population_random.randint(1500, 2500)
+        self.last_turn_around_animation_time = get_ticks()
         self.attack_cooldown = 1500
         self.about_to_attack_time_cooldown = 280
         self.about_to_attack_time = 0
@@ -491,55 +512,56 @@ class Enemy(Character):
         #print(moved, distance, goal_position, self.rect.center, dx, dy)
 
         if distance < self.damage_collider.collision_rect.inflate(-10, -10).width or not moved:
-            if self.last_known_player_position is not None and not self.in_line_of_sight(player_rect, walls):
+            if self.last_known_player_position is not None and not self.in_line_of_sight(player_rect, wall_grid):
                 self.last_known_player_position = None
             self.roam_position = None
-            self.last_roam_time = pg.time.get_ticks()
-            self.last_turn_around_animation_time = pg.time.get_ticks()
-            self.roam_wait_time = random.randint(1000, 1500)
+            self.last_roam_time = get_ticks()
+            self.last_turn_around_animation_time = get_ticks()
+            self.roam_wait_time = ai_random.randint(1000, 1500)
 
     def launch_attack(self):
-        if self.attack_dir and pg.time.get_ticks() - self.about_to_attack_time > self.about_to_attack_time_cooldown:
+        if self.attack_dir and get_ticks() - self.about_to_attack_time > self.about_to_attack_time_cooldown:
             self.attack_function()
             #self.slash_attack(self.attack_dir, 0.8)
             self.attack_dir = None
             self.about_to_attack_time = 0
 
     def prepare_attack(self, player_rect):
-        if pg.time.get_ticks() - self.last_attack_time > self.attack_cooldown:
+        if get_ticks() - self.last_attack_time > self.attack_cooldown:
             if abs(self.rect.x - player_rect.x) > abs((self.rect.y - player_rect.y)):
                 self.attack_dir = [math.copysign(1, player_rect.x - self.rect.x), 0]
             else:
                 self.attack_dir = [0, math.copysign(1, self.rect.y - player_rect.y)]
-            self.about_to_attack_time = pg.time.get_ticks()
+            self.about_to_attack_time = get_ticks()
 
-    def roam_to(self, camera):
+    def roam_to(self):
         # draw destination
-        self.in_line_of_sight(pg.Rect(self.roam_position[0], self.roam_position[1], 1, 1), walls, True, camera)
+        if debug_overlay.enabled("vision"):
+            debug_overlay.line((255, 255, 0), self.rect.center, self.roam_position, 2, self)
 
         self.move_enemy(self.roam_position)
 
-    def choose_where_to_roam(self, camera):
+    def choose_where_to_roam(self):
         min_range = 0
-        max_range = random.randint(200, 400)
+        max_range = ai_random.randint(200, 400)
 
-        random_distance = random.randint(min_range, max_range)
-        random_point = pg.Rect(self.rect.move(random_distance * [-1, 1][random.randint(0, 1)],
-                                              (max_range - random_distance) * [-1, 1][random.randint(0, 1)]))
+        random_distance = ai_random.randint(min_range, max_range)
+        random_point = pg.Rect(self.rect.move(random_distance * [-1, 1][ai_random.randint(0, 1)],
+                                              (max_range - random_distance) * [-1, 1][ai_random.randint(0, 1)]))
         random_point.width = 1
         random_point.height = 1
 
-        if self.in_line_of_sight(random_point, walls, True, camera, inflate_value=5):
+        if self.in_line_of_sight(random_point, wall_grid, True, inflate_value=5, draw_ray=True):
             self.roam_position = (random_point.x, random_point.y)
 
     def handle_spotting(self, player_rect):
         if self.last_known_player_position is None and self.spotted_time is None:
             visuals.add(NotificationVisual(load_images_from_folder("assets/effects/spotted"), self.damage_collider.collision_rect.move(0, -65)))
             self.flip_model_on_move(player_rect.x - self.rect.x)
-            self.spotted_time = pg.time.get_ticks()
+            self.spotted_time = get_ticks()
 
         self.last_known_player_position = (player_rect.centerx, player_rect.centery)
-        if self.spotted_time and pg.time.get_ticks() - self.spotted_time < self.spotted_wait_duration:
+        if self.spotted_time and get_ticks() - self.spotted_time < self.spotted_wait_duration:
             if self.idle_images:
                 self.change_images(self.idle_images[self.get_direction_index(self.move_direction)])
                 self.mode = "idle"
@@ -559,17 +581,17 @@ class Enemy(Character):
             self.mode = "dead"
             self.cur_frame = 0
 
-    def update(self, camera, player_rect, *args, **kwargs):
+    def update(self, player_rect, *args, **kwargs):
         if self.mode == "dead":
-            self.movement_collider.update(self.rect, camera)
-            self.damage_collider.update(self.rect, camera)
+            self.movement_collider.update(self.rect, self)
+            self.damage_collider.update(self.rect, self)
 
             if self.death_images and self.cur_frame == 0:
                 self.change_images(self.death_images[self.get_direction_index(self.move_direction)])
                 # self.frame_duration = 180
             elif self.death_images is None:
                 explosion_images = load_images_from_folder("assets/effects/explosion")
-                visuals.add(Visual(explosion_images, self.damage_collider.collision_rect.inflate(20, 20), pg.time.get_ticks(), 400))
+                visuals.add(Visual(explosion_images, self.damage_collider.collision_rect.inflate(20, 20), get_ticks(), 400))
                 characters.remove(self)
 
             if self.cur_frame != self.last_frame:
@@ -579,7 +601,7 @@ class Enemy(Character):
 
             return
 
-        super().update(camera)
+        super().update()
 
         # handle knockback
         is_min_velocity_to_knockback = (abs(self.velocity_x) > 0.03 or abs(self.velocity_y) > 0.03)
@@ -588,16 +610,16 @@ class Enemy(Character):
 
         if self.about_to_attack_time != 0:
             self.launch_attack()
-        elif self.in_line_of_sight(player_rect, walls, False, camera):
+        elif self.in_line_of_sight(player_rect, wall_grid, False, draw_ray=True):
             self.handle_spotting(player_rect)
         elif self.last_known_player_position:
             self.move_enemy(self.last_known_player_position, player_rect)
         elif self.roam_position:
-            self.roam_to(camera)
+            self.roam_to()
         else:
             # todo: refactor like hurt animation
-            wait_dt = pg.time.get_ticks() - self.last_roam_time
-            animation_dt = pg.time.get_ticks() - self.last_turn_around_animation_time
+            wait_dt = get_ticks() - self.last_roam_time
+            animation_dt = get_ticks() - self.last_turn_around_animation_time
 
             if wait_dt < self.roam_wait_time - 50:
                 if self.idle_images and self.mode != "idle":
@@ -607,33 +629,31 @@ class Enemy(Character):
 
                 if animation_dt < self.roam_wait_time/2:
                     self.flipped_x = not self.flipped_x
-                    self.last_turn_around_animation_time = pg.time.get_ticks()
+                    self.last_turn_around_animation_time = get_ticks()
             else:
                 # chose random point, check if in line of sight
-                self.choose_where_to_roam(camera)
+                self.choose_where_to_roam()
 
     def is_colliding_with_walls(self, dx, dy, obstacles):
         self.movement_collider.update(self.rect)
         new_rect = self.movement_collider.collision_rect.move(dx, dy)
-        for wall in obstacles:
-            if wall.rect.colliderect(new_rect):
-                return True
-        return False
+        return obstacles.collides(new_rect)
 
-    def in_line_of_sight(self, position_rect, obstacles, ignore_view_distance=False, camera=None, inflate_value=-1):
+    def in_line_of_sight(self, position_rect, obstacles, ignore_view_distance=False, inflate_value=-1, draw_ray=False):
         # draw the vision ray
-        if camera:
-            vision_start = self.rect.centerx - camera.rect.x, self.rect.centery - camera.rect.y
-            pos = position_rect.centerx - camera.rect.x, position_rect.centery - camera.rect.y
-
-            pg.draw.line(screen, (255, 255, 0), vision_start, pos, 2)
+        if draw_ray and debug_overlay.enabled("vision"):
+            debug_overlay.line((255, 255, 0), self.rect.center, position_rect.center, 2, self)
 
         if not ignore_view_distance and math.dist((self.rect.centerx, self.rect.centery), (position_rect.centerx, position_rect.centery)) > 250:
             return False
 
-        for obstacle in obstacles:
-            if (obstacle.rect.inflate(inflate_value, inflate_value).move(-1 * math.copysign(15, position_rect.centerx), -1 * math.copysign(15, position_rect.centery))
-                    .clipline(self.rect.center,position_rect.center)):
+        # only the wall tiles around the ray can block it
+        offset = (-1 * math.copysign(15, position_rect.centerx), -1 * math.copysign(15, position_rect.centery))
+        start, end = self.rect.center, position_rect.center
+        ray_rect = pg.Rect(min(start[0], end[0]), min(start[1], end[1]), abs(end[0] - start[0]) + 1, abs(end[1] - start[1]) + 1)
+        reach = 2 * abs(inflate_value) + 2
+        for obstacle_rect in obstacles.wall_rects(ray_rect.move(-offset[0], -offset[1]).inflate(reach, reach)):
+            if obstacle_rect.inflate(inflate_value, inflate_value).move(offset).clipline(start, end):
                 return False
 
         return True
@@ -662,6 +682,8 @@ class SkeletonEnemy(Enemy, SlashAttacker):
         self.distance_prepare_attack = 2200
         self.about_to_attack_time_cooldown = 0
 
+        skeleton_enemy_images = get_skeleton_enemy_images()
+
         off_x = 55
         off_y = 50
         self.movement_collider = Collider((off_x//2, self.rect.height - off_y), (self.rect.width - off_x, 20))
@@ -692,7 +714,7 @@ class SkeletonEnemy(Enemy, SlashAttacker):
         attack = {
             'dim': [size_x, size_y],
             'dest': [dest_x, dest_y],
-            'start_time': pg.time.get_ticks(),
+            'start_time': get_ticks(),
             'duration': 10,
             'flipped_x': False,
             'flipped_y': False,
@@ -716,7 +738,7 @@ class PlayerUpgradeItem(Item):
 
 class MerchantItem(Item, ActionObject):
     def __init__(self, item, price, description=None):
-        Item.__init__(self, [pg.image.load("assets/x.png")], item.rect.x, item.rect.y, item.frame_duration, item.rect.size)
+        Item.__init__(self, [load_image("assets/x.png")], item.rect.x, item.rect.y, item.frame_duration, item.rect.size)
         ActionObject.__init__(self, self.rect, self.sell, CHARACTER_SIZE)
         self.item_to_sell = item
 
@@ -725,6 +747,7 @@ class MerchantItem(Item, ActionObject):
         self.price = price
         self.bought = False
         self.description = description
+        self.description_block = None
 
     def sell(self, player, action_objects):
         if player.coins >= self.price >= 0:
@@ -734,30 +757,26 @@ class MerchantItem(Item, ActionObject):
             player.add_item(self.item_to_sell)
 
     def render(self, camera, player):
-        screen.blit(self.image, (self.rect.x - camera.rect.x, self.rect.y - camera.rect.y))
+        # placed like the sprites, between where the last two steps left the item and the camera
+        camera_x, camera_y = interpolation.position(camera)
+        item_x, item_y = interpolation.position(self)
+        x, y = item_x - camera_x, item_y - camera_y
+        draw_queue.blit("world", self.image, (x, y))
 
         color = (255, 0, 0) if self.is_close(player) else (255, 255, 255)
 
-        text = font.render(str(self.price) + "$", True, color)
-        screen.blit(text, (self.rect.x - camera.rect.x, self.rect.y - camera.rect.y + self.image.get_height() + 10))
+        text = text_cache.render(get_font(), str(self.price) + "$", color)
+        draw_queue.blit("world", text, (x, y + self.image.get_height() + 10))
 
         if self.description and self.is_close(player):
-            words = self.description.split(" ")
-            longest_word = max(self.description.split(), key=len)
-
-            box_width = font_s.render(longest_word, True, (0, 0, 0)).get_width()
-
-            off_x = 20
-            off_y = 20
-            transparent_surface = pg.Surface((box_width + off_x, len(words) * font_s.get_height() + off_y), pg.SRCALPHA)
-            transparent_surface.fill((0, 0, 0, 168))
-            screen.blit(transparent_surface, (self.rect.centerx - camera.rect.x - box_width//2 - off_x//2, self.rect.y - camera.rect.y - len(words) * font_s.get_height() - off_y//2 - 20))
-
-            for i, word in enumerate(words):
-                description_text = font_s.render(word, True, (255, 255, 255))
+            if self.description_block is None:
+                longest_word = max(self.description.split(), key=len)
+                self.description_block = TextBlock(get_small_font(), self.description.split(" "), text_width=get_small_font().size(longest_word)[0])
 
-                screen.blit(description_text, (self.rect.centerx - camera.rect.x - description_text.get_width()//2,
-                                               self.rect.y - camera.rect.y - (len(words) - i) * description_text.get_height() - 20))
+            block = self.description_block
+            block_x = x + self.rect.width // 2 - block.text_width // 2 - block.padding[0] // 2
+            block_y = y - block.text_height - block.padding[1] // 2 - 20
+            draw_queue.blits("world", block.blits((block_x, block_y)))
 
 
 class Merchant(Character):
@@ -776,7 +795,8 @@ class Merchant(Character):
         self.damage_collider = Collider((1, 1), (self.rect.width, self.rect.height), (255, 0, 0))
 
     def create_random_player_upgrade(self, pos_x, pos_y):
-        image = [player_upgrades_images[random.randint(0, len(player_upgrades_images)-1)]]
+        player_upgrades_images = get_player_upgrades_images()
+        image = [player_upgrades_images[loot_random.randint(0, len(player_upgrades_images)-1)]]
 
         stats = {
             "movement_speed": [1.05, 1.1],
@@ -786,12 +806,12 @@ class Merchant(Character):
             "attack_size": [1.05, 1.2],
         }
 
-        stat = random.choice(list(stats.keys()))
+        stat = loot_random.choice(list(stats.keys()))
         modifier_range = stats[stat]
         modifier_range = list(map(lambda x: x * 1, modifier_range))
-        modifier = random.uniform(modifier_range[0], modifier_range[1])
+        modifier = loot_random.uniform(modifier_range[0], modifier_range[1])
 
-        price = random.randint(0, 20) + 10
+        price = loot_random.randint(0, 20) + 10
         description = "Increase " + " ".join(stat.split("_"))
 
         return MerchantItem(PlayerUpgradeItem(image, pos_x, pos_y, stat, modifier), price, description=description)
@@ -800,14 +820,14 @@ class Merchant(Character):
         for item in self.items_to_sell:
             item.render(camera, player)
 
-    def update(self, camera, *args, **kwargs):
-        super().update(camera)
+    def update(self, *args, **kwargs):
+        super().update()
 
         for i, item in enumerate(self.items_to_sell):
             item.update()
 
             if item.bought:
-                new_item = MerchantItem(Item([pg.image.load("assets/x.png")], 0, 0, 500, [item.rect.width, item.rect.height]), -1)
+                new_item = MerchantItem(Item([load_image("assets/x.png")], 0, 0, 500, [item.rect.width, item.rect.height]), -1)
                 new_item.rect = item.rect
                 self.items_to_sell[i] = new_item
 
@@ -0,0 +1,41 @@
+import pygame as pg
+
+
+def wall_mask(wall_classes):
+    # translate table turning a layer's tile classes into 1 for walls and 0 for anything else
+    return bytes(tile_class in wall_classes for tile_class in range(256))
+
+
+class WallGrid:
+    # which tile cells of the current level are walls, one byte per cell, filled once when the level is built
+    # from its layouts. a rect collides with the walls exactly when one of the cells it overlaps is a wall,
+    # whether the rooms or chunks around it are loaded or not
+    def __init__(self):
+        self.fill(1, 0, 0, bytearray())
+
+    def fill(self, tile_size, width, height, cells):
+        self.tile_size = tile_size
+        self.width = width
+        self.height = height
+        self.cells = cells
+
+    def cell_span(self, rect):
+        # (left, top, right, bottom) cells the rect overlaps, clipped to the grid, right and bottom exclusive
+        size = self.tile_size
+        return (max(rect.left // size, 0), max(rect.top // size, 0),
+                min((rect.right - 1) // size + 1, self.width), min((rect.bottom - 1) // size + 1, self.height))
+
+    def collides(self, rect):
+        # same as any(wall.rect.colliderect(rect) for wall in walls)
+        if rect.width <= 0 or rect.height <= 0:
+            return False
+
+        left, top, right, bottom = self.cell_span(rect)
+        return any(any(self.cells[row * self.width + left:row * self.width + right]) for row in range(top, bottom))
+
+    def wall_rects(self, rect):
+        # the rects of the wall tiles overlapping the rect
+        size = self.tile_size
+        left, top, right, bottom = self.cell_span(rect)
+        return [pg.Rect(col * size, row * size, size, size)
+                for row in range(top, bottom) for col in range(left, right) if self.cells[row * self.width + col]]
@@ -0,0 +1,101 @@
+import pygame as pg
+
+# the render index files sprites by square world chunks of this many pixels
+render_chunk_size = 512
+# sprites are also drawn this many pixels around the screen, a few are drawn a little outside of their rect
+view_margin = 128
+
+
+def drawn_rect(sprite):
+    return pg.Rect(sprite.rect.topleft, sprite.image.get_size())
+
+
+def chunk_span(rect):
+    return (rect.left // render_chunk_size, rect.top // render_chunk_size,
+            (rect.right - 1) // render_chunk_size, (rect.bottom - 1) // render_chunk_size)
+
+
+def span_chunks(span):
+    left, top, right, bottom = span
+    return [(col, row) for row in range(top, bottom + 1) for col in range(left, right + 1)]
+
+
+class IndexedGroup(pg.sprite.Group):
+    # a sprite group that also files its sprites by the world chunks they are drawn over, so a frame
+    # only looks at the sprites around the camera. sprites are filed once when added, only those of
+    # classes that move (moves = True) are checked again by refresh() every frame
+    def __init__(self, *sprites):
+        self.chunks = {}
+        self.spans = {}
+        self.moving = set()
+        # drawing keeps the order the sprites were added in, like iterating the group does
+        self.order = {}
+        self.next_order = 0
+        super().__init__(*sprites)
+
+    def add_internal(self, sprite, layer=None):
+        super().add_internal(sprite, layer)
+        self.order[sprite] = self.next_order
+        self.next_order += 1
+        self.file(sprite)
+        if getattr(sprite, "moves", False):
+            self.moving.add(sprite)
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        self.unfile(sprite)
+        del self.order[sprite]
+        self.moving.discard(sprite)
+
+    def file(self, sprite):
+        span = self.spans[sprite] = chunk_span(drawn_rect(sprite))
+        for chunk in span_chunks(span):
+            self.chunks.setdefault(chunk, set()).add(sprite)
+
+    def unfile(self, sprite):
+        for chunk in span_chunks(self.spans.pop(sprite)):
+            sprites = self.chunks[chunk]
+            sprites.discard(sprite)
+            if not sprites:
+                del self.chunks[chunk]
+
+    def refresh(self):
+        for sprite in self.moving:
+            if chunk_span(drawn_rect(sprite)) != self.spans[sprite]:
+                self.unfile(sprite)
+                self.file(sprite)
+
+    def visible(self, view):
+        self.refresh()
+
+        candidates = set()
+        for chunk in span_chunks(chunk_span(view)):
+            candidates.update(self.chunks.get(chunk, ()))
+        return sorted((sprite for sprite in candidates if drawn_rect(sprite).colliderect(view)), key=self.order.get)
+
+
+def visible_sprites(sprites, view):
+    # groups are looked up in their index, plain lists (arrows and the like) are checked one by one
+    if isinstance(sprites, IndexedGroup):
+        return sprites.visible(view)
+    return [sprite for sprite in sprites if drawn_rect(sprite).colliderect(view)]
+
+
+class RenderStats:
+    # how many sprites the last frame drew and how many it skipped as off-screen
+    def __init__(self):
+        self.drawn = 0
+        self.skipped = 0
+
+    def visible(self, sprites, view):
+        visible = visible_sprites(sprites, view)
+        self.drawn += len(visible)
+        self.skipped += len(sprites) - len(visible)
+        return visible
+
+    def reset(self):
+        self.drawn = 0
+        self.skipped = 0
+
+
+render_stats = RenderStats()
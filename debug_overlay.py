@@ -0,0 +1,88 @@
+import os
+
+import pygame as pg
+
+from shared import rendering_enabled
+from culling import render_chunk_size, chunk_span, span_chunks
+from renderer import draw_queue
+from timestep import interpolation
+
+debug_categories = ["colliders", "vision", "visuals", "render_chunks", "render_stats"]
+# F3 turns everything on or off, the others toggle one category
+debug_hotkeys = {
+    pg.K_F4: "colliders",
+    pg.K_F5: "vision",
+    pg.K_F6: "visuals",
+    pg.K_F7: "render_chunks",
+    pg.K_F8: "render_stats",
+}
+
+
+def categories_from_env():
+    # PYGEON_DEBUG=all or a comma separated list of categories
+    value = os.environ.get("PYGEON_DEBUG", "")
+    if value == "all":
+        return set(debug_categories)
+    return {category for category in value.split(",") if category in debug_categories}
+
+
+class DebugOverlay:
+    # debug shapes are collected in world coordinates while the game updates and queued on the debug layer
+    # in one pass. the game only builds a shape after checking enabled(), so a category that is off costs nothing.
+    # a shape with an owner moves along with where the owner is drawn between steps
+    def __init__(self, categories):
+        self.categories = set(categories)
+        self.lines = []
+        self.rects = []
+
+    def enabled(self, category):
+        return category in self.categories and rendering_enabled()
+
+    def toggle(self, category=None):
+        if category is None:
+            self.categories = set() if self.categories else set(debug_categories)
+        else:
+            self.categories ^= {category}
+
+    def handle_events(self, events):
+        for event in events:
+            if event.type != pg.KEYDOWN:
+                continue
+            if event.key == pg.K_F3:
+                self.toggle()
+            elif event.key in debug_hotkeys:
+                self.toggle(debug_hotkeys[event.key])
+
+    def line(self, color, start, end, width=1, owner=None):
+        self.lines.append((color, start, end, width, owner))
+
+    def rect(self, color, rect, owner=None):
+        self.rects.append((color, pg.Rect(rect), owner))
+
+    def render_chunks(self, group, view):
+        # the chunks of the render index around the camera that hold sprites of the group
+        for chunk in span_chunks(chunk_span(view)):
+            if chunk in group.chunks:
+                col, row = chunk
+                self.rect((255, 0, 255), (col * render_chunk_size, row * render_chunk_size, render_chunk_size, render_chunk_size))
+
+    def draw(self, camera):
+        camera_x, camera_y = interpolation.position(camera)
+
+        def offset(owner):
+            if owner is None:
+                return -camera_x, -camera_y
+            x, y = interpolation.position(owner)
+            return x - owner.rect.x - camera_x, y - owner.rect.y - camera_y
+
+        for color, rect, owner in self.rects:
+            draw_queue.rect("debug", color, rect.move(offset(owner)), 1)
+        for color, start, end, width, owner in self.lines:
+            off_x, off_y = offset(owner)
+            draw_queue.line("debug", color, (start[0] + off_x, start[1] + off_y), (end[0] + off_x, end[1] + off_y), width)
+
+        self.lines.clear()
+        self.rects.clear()
+
+
+debug_overlay = DebugOverlay(categories_from_env())
@@ -1,48 +1,76 @@
-from copy import deepcopy
-import pygame as pg
-from characters import Player, Merchant, Enemy, SkeletonEnemy, SkeletonScytheEnemy
-from map_generation import connect_rooms, generate_map, room_objects, objects_map, generate_overworld
-from shared import WALL_SIZE, characters, CHARACTER_SIZE, ground, walls, decorations, items, traps, visuals
-from ui import trim_matrix
+from collections import deque
+
+from characters import Player, Merchant, Enemy
+from map_generation import build_level_steps, objects_map, generate_overworld_steps, materialize_room, \
+    dematerialize_far_rooms, dematerialize_distance, add_spawn, room_descriptions, get_overworld_chunks_around, \
+    get_overworld_chunk, bake_overworld_chunk, overworld_chunk_size, overworld_tile_size
+from level_generation import level_pregenerator, generate_level_steps, run_steps, scale_progress, PhaseTimings, \
+    room_width, room_height
+from shared import WALL_SIZE, characters, CHARACTER_SIZE, ground, decorations, items, traps, visuals, get_ticks, \
+    furniture, doors, SCREEN_WIDTH, SCREEN_HEIGHT
+from tiles import BakedLayer
 from utility import Camera
+from rng import next_level_seed, peek_level_seed, seed_level
 
 
 class OverworldMap():
-    def __init__(self):
-        w, h = generate_overworld()
+    def __init__(self, build=True):
+        self.timings = PhaseTimings()
+
+        # without build, the caller runs build_steps itself, e.g. a slice per frame
+        if build:
+            run_steps(self.build_steps())
+
+    def build_steps(self):
+        w, h = yield from generate_overworld_steps(self.timings)
 
         self.width_px = w
         self.height_px = h
 
 
 class DungeonMap():
-    def __init__(self):
-        rooms = [i + 1 for i in range(20)]
-        self.room_map = connect_rooms(rooms)
-        self.mini_map = trim_matrix(self.room_map)
-        self.discovered_mini_map = deepcopy(self.mini_map)
-        for y, row in enumerate(self.discovered_mini_map):
-            for x, el in enumerate(row):
-                if el != 1:
-                    self.discovered_mini_map[y][x] = 0
+    def __init__(self, seed=None, build=True):
+        # the same seed always generates the same level, however long the game has been running
+        self.seed = seed if seed is not None else next_level_seed()
 
-        w, h, objects_map = generate_map(self.room_map)
+        if build:
+            run_steps(self.build_steps())
+
+    def build_steps(self):
+        level = level_pregenerator.take(self.seed)
+        if level is None:
+            level = yield from scale_progress(generate_level_steps(self.seed), 0, 0.5)
+        # a level from the worker never touched this process' streams, they are seeded the same either way,
+        # so e.g. the merchant's stock only depends on the seed
+        seed_level(level.seed)
+        self.timings = level.timings
+
+        self.room_graph = level.room_graph
+        self.discovered_rooms = {self.room_graph.start_room}
+
+        w, h, objects_map = yield from scale_progress(build_level_steps(level, self.timings), 0.5, 1)
 
         self.width_px = w
         self.height_px = h
         self.objects_map = objects_map
 
+        # the player starts in the middle of the start room
+        start_row, start_col = self.room_graph.positions[self.room_graph.start_room]
+        self.start_x_px = (start_col * room_width + room_width // 2) * WALL_SIZE
+        self.start_y_px = (start_row * room_height + room_height // 2) * WALL_SIZE
+
         self.current_map_cell = 0
+        self.mini_map = None
+        self.mini_map_key = None
 
     def update(self, player):
-        new_cell = self.room_map[int(player.rect.centery // WALL_SIZE // 16)][int(player.rect.centerx // WALL_SIZE // 16)]
+        new_cell = self.room_graph.room_at(int(player.rect.centery // WALL_SIZE // room_height),
+                                           int(player.rect.centerx // WALL_SIZE // room_width))
 
         if self.current_map_cell != new_cell:
             #update mini-map
-            for y, row in enumerate(self.mini_map):
-                for x, el in enumerate(row):
-                    if el == new_cell:
-                        self.discovered_mini_map[y][x] = new_cell
+            if new_cell != 0:
+                self.discovered_rooms.add(new_cell)
             self.current_map_cell = new_cell
             return True
         else:
@@ -50,20 +78,152 @@ class DungeonMap():
             # update the decorations and etc to the ones within the room
             return False
 
+    def mini_map_window(self, radius=2):
+        # the discovered rooms around the player's room, None outside of the rooms. rooms are only discovered
+        # by entering them, so the window is kept until the player changes rooms
+        key = (self.current_map_cell, radius)
+        if self.mini_map_key != key:
+            self.mini_map_key = key
+            self.mini_map = None
+            if self.current_map_cell in self.room_graph.positions:
+                self.mini_map = [[room_id if room_id in self.discovered_rooms else 0 for room_id in row]
+                                 for row in self.room_graph.rooms_around(self.current_map_cell, radius)]
+        return self.mini_map
+
+
+class RoomStreamer():
+    # keeps the rooms around the player in the sprite groups, a room change only adds and removes
+    # the rooms entering or leaving the neighbourhood
+    def __init__(self, objects_map, room_graph):
+        self.objects_map = objects_map
+        self.room_graph = room_graph
+        self.loaded_rooms = set()
+        self.active_room = None
+        # rooms the player can reach from the next room change, built one per frame beforehand
+        self.upcoming_rooms = deque()
+        self.groups = {
+            "ground": ground,
+            "decorations": decorations,
+            "items": items,
+            "traps": traps,
+        }
+
+        # starts from empty groups, whatever the previous level left in them
+        for group in self.groups.values():
+            group.empty()
+        characters.remove([char for char in characters if isinstance(char, Enemy)])
+
+    def move_to(self, room_id):
+        # between rooms the previous neighbourhood stays loaded
+        if room_id not in room_descriptions:
+            return
+        nearby_rooms = set(self.room_graph.nearby_rooms(room_id))
+
+        # enemies only move and fight in the player's room
+        if self.active_room in self.objects_map:
+            characters.remove(self.objects_map[self.active_room]["characters"])
+
+        for leaving_room in self.loaded_rooms - nearby_rooms:
+            self.unload(leaving_room)
+
+        # rooms are only built once the player gets near them, and dropped again once far away. most were
+        # already built ahead, only a player faster than that waits for the rest here
+        for entering_room in nearby_rooms - self.loaded_rooms:
+            materialize_room(entering_room)
+            self.load(entering_room)
+        dematerialize_far_rooms(self.room_graph, room_id)
+        self.upcoming_rooms = deque(other for row in self.room_graph.rooms_around(room_id, dematerialize_distance)
+                                    for other in row if other != 0 and other not in self.objects_map)
+
+        if room_id in self.objects_map:
+            characters.add([enemy for enemy in self.objects_map[room_id]["characters"] if enemy.health > 0])
+        self.active_room = room_id
+
+        visuals.empty()
+
+    def build_ahead(self):
+        if self.upcoming_rooms:
+            materialize_room(self.upcoming_rooms.popleft())
+
+    def load(self, room_id):
+        objects = self.objects_map[room_id]
+        for label, group in self.groups.items():
+            if label == "items":
+                group.add([item for item in objects[label] if not item.picked_up])
+            else:
+                group.add(objects[label])
+        self.loaded_rooms.add(room_id)
+
+    def unload(self, room_id):
+        objects = self.objects_map[room_id]
+        for label, group in self.groups.items():
+            group.remove(objects[label])
+        self.loaded_rooms.discard(room_id)
+
+
+class ChunkStreamer():
+    # keeps the overworld chunks around the camera in the sprite groups, like RoomStreamer does for rooms
+    def __init__(self):
+        # chunk -> the sprite its bake is drawn with
+        self.loaded_chunks = {}
+        self.centre = None
+        self.groups = {
+            "doors": doors,
+            "furniture": furniture,
+            "decorations": decorations,
+        }
+
+        ground.empty()
+        for group in self.groups.values():
+            group.empty()
+
+    def update(self, camera):
+        centre_x = camera.rect.x + SCREEN_WIDTH // 2
+        centre_y = camera.rect.y + SCREEN_HEIGHT // 2
+        chunk_px = overworld_chunk_size * overworld_tile_size
+        centre = (int(centre_y // chunk_px), int(centre_x // chunk_px))
+        if centre == self.centre:
+            return
+        self.centre = centre
+
+        nearby_chunks = set(get_overworld_chunks_around(centre_x, centre_y))
+        for leaving_chunk in set(self.loaded_chunks) - nearby_chunks:
+            self.unload(leaving_chunk)
+        for entering_chunk in nearby_chunks - set(self.loaded_chunks):
+            self.load(entering_chunk)
+
+    def load(self, chunk):
+        objects = get_overworld_chunk(chunk)
+        for label, group in self.groups.items():
+            group.add(objects[label])
+
+        chunk_row, chunk_col = chunk
+        layer = BakedLayer(bake_overworld_chunk(chunk), chunk_col * overworld_chunk_size,
+                           chunk_row * overworld_chunk_size, overworld_tile_size)
+        ground.add(layer)
+        self.loaded_chunks[chunk] = layer
+
+    def unload(self, chunk):
+        objects = get_overworld_chunk(chunk)
+        for label, group in self.groups.items():
+            group.remove(objects[label])
+        ground.remove(self.loaded_chunks.pop(chunk))
+
 
 class Game():
-    def __init__(self, current_player=None, scene="overworld"):
+    def __init__(self, current_player=None, scene="overworld", seed=None, game_map=None):
         self.scene = scene
         self.running = True
 
         if self.scene == "underworld":
-            self.map = DungeonMap()
+            self.map = game_map or DungeonMap(seed)
 
-            player_start_x = self.map.width_px // 2 - CHARACTER_SIZE
-            player_start_y = self.map.height_px // 2 - CHARACTER_SIZE
+            player_start_x = self.map.start_x_px - CHARACTER_SIZE
+            player_start_y = self.map.start_y_px - CHARACTER_SIZE
 
-            self.defeat_timer_start = pg.time.get_ticks()
+            self.defeat_timer_start = get_ticks()
             self.objects_map = self.map.objects_map
+            self.room_streamer = RoomStreamer(self.objects_map, self.map.room_graph)
 
             if not current_player:
                 self.player = Player(player_start_x, player_start_y)
@@ -74,12 +234,11 @@ class Game():
 
             self.camera = Camera(self.map.width_px, self.map.height_px, self.player)
 
-            merchant = Merchant(self.map.width_px // 2 - CHARACTER_SIZE, self.map.height_px // 2 - 220 - CHARACTER_SIZE)
-            ch2 = SkeletonEnemy(self.player.rect.x, self.player.rect.y + 310)
+            merchant = Merchant(self.map.start_x_px - CHARACTER_SIZE, self.map.start_y_px - 220 - CHARACTER_SIZE)
+            ch2 = add_spawn(1, "characters", "skeleton_enemy", self.player.rect.x / WALL_SIZE, (self.player.rect.y + 310) / WALL_SIZE)
             characters.add(self.player, merchant, ch2)
-            objects_map[1]["characters"].append(ch2)
         elif self.scene == "overworld":
-            self.map = OverworldMap()
+            self.map = game_map or OverworldMap()
 
             player_start_x = self.map.width_px // 2 - CHARACTER_SIZE - 180
             player_start_y = self.map.height_px // 2 - CHARACTER_SIZE
@@ -91,59 +250,18 @@ class Game():
                 self.player.rect.x = player_start_x
                 self.player.rect.y = player_start_y
             self.camera = Camera(self.map.width_px, self.map.height_px, self.player)
+            self.chunk_streamer = ChunkStreamer()
+            self.chunk_streamer.update(self.camera)
 
             characters.add(self.player)
 
+        # whichever way the player goes down next, that level is generated in the background meanwhile
+        level_pregenerator.start(peek_level_seed())
+
     def clear_groups(self):
-        groups = [ground, walls, decorations, items, traps, visuals]
+        groups = [ground, doors, furniture, decorations, items, traps, visuals]
         for grp in groups:
             grp.empty()
 
-    def render_appropriate_room(self, current_map_cell, room_map):
-        self.clear_groups()
-
-        for char in characters.sprites():
-            if isinstance(char, Enemy):
-                characters.remove(char)
-
-        cells = [current_map_cell]
-        for i, row in enumerate(room_map):
-            for j, cell in enumerate(row):
-                if cell == current_map_cell:
-                    if j - 1 >= 0:
-                        cells.append(room_map[i][max(0, j - 1)])
-                    if j + 1 < len(row):
-                        cells.append(room_map[i][min(len(row) - 1, j + 1)])
-                    if i - 1 >= 0:
-                        cells.append(room_map[max(0, i - 1)][j])
-                    if i + 1 < len(room_map):
-                        cells.append(room_map[min(len(room_map) - 1, i + 1)][j])
-                    if i - 1 >= 0 and j - 1 >= 0:
-                        cells.append(room_map[max(0, i - 1)][max(0, j - 1)])
-                    if i + 1 < len(room_map) and j - 1 >= 0:
-                        cells.append(room_map[min(len(room_map) - 1, i + 1)][max(0, j - 1)])
-                    if i - 1 >= 0 and j + 1 < len(row):
-                        cells.append(room_map[max(0, i - 1)][min(len(row) - 1, j + 1)])
-                    if i + 1 < len(room_map) and j + 1 < len(row):
-                        cells.append(room_map[min(len(room_map) - 1, i + 1)][min(len(row) - 1, j + 1)])
-
-        for cell in cells:
-            objects = self.objects_map[cell]
-            for label in objects:
-                if label == "ground":
-                    ground.add(objects[label])
-                elif label == "decorations":
-                    decorations.add(objects[label])
-                elif label == "walls":
-                    walls.add(objects[label])
-                elif label == "items":
-                    items.add(objects[label])
-                elif label == "traps":
-                    traps.add(objects[label])
-                elif label == "characters":
-                    for obj in objects[label]:
-                        if obj.health > 0 and cell == current_map_cell: # add enemies only in the current cell
-                            characters.add(obj)
-
-
-
+    def render_appropriate_room(self, current_map_cell):
+        self.room_streamer.move_to(current_map_cell)
@@ -1,11 +1,19 @@
-import random
 from copy import deepcopy
 
 import pygame as pg
 
 from tiles import MapTile
-from shared import WALL_SIZE, visuals, font, screen, SCREEN_WIDTH
+from shared import WALL_SIZE, visuals, get_font, SCREEN_WIDTH, get_ticks, rendering_enabled
 from utility import load_images_from_folder, NotificationVisual, Animated, ActionObject
+from asset_cache import transform_cache, text_cache
+from preload import preloader
+from renderer import draw_queue
+from rng import loot_random
+
+preloader.declare("underworld", "folder", "assets/items_and_traps_animations/keys/silver",
+                  "assets/items_and_traps_animations/chest/normal", "assets/items_and_traps_animations/chest/open",
+                  "assets/items_and_traps_animations/coin")
+preloader.declare("overworld", "folder", "assets/effects/spotted")
 
 
 class Item(pg.sprite.Sprite, Animated):
@@ -14,6 +22,7 @@ class Item(pg.sprite.Sprite, Animated):
         self.rect = pg.Rect(x + (WALL_SIZE - size[0])//2, y + (WALL_SIZE - size[1])//2, size[0], size[1])
         Animated.__init__(self, images, size, frame_duration, False, False, rotate)
         self.pickable = False
+        self.picked_up = False
 
     def update(self, *args, **kwargs):
         self.animate_new_frame()
@@ -47,14 +56,14 @@ class Chest(Item):
         if not self.opened:
             return
 
-        if self.flash_count < self.max_flash_count and pg.time.get_ticks() - self.last_flash_time > 140:
+        if self.flash_count < self.max_flash_count and get_ticks() - self.last_flash_time > 140:
             self.animate()
             self.flash_count += 1
-            self.last_flash_time = pg.time.get_ticks()
+            self.last_flash_time = get_ticks()
 
         if self.cur_frame == self.last_frame and not self.added_visual:
             visuals.add(NotificationVisual(load_images_from_folder("assets/items_and_traps_animations/coin"), self.rect.move(-WALL_SIZE * 0.1, -60), True, 1600, iterations=3))
-            player.coins += random.randint(10, 25)
+            player.coins += loot_random.randint(10, 25)
             self.added_visual = True
 
 
@@ -63,12 +72,21 @@ class Chest(Item):
             self.cur_frame = 0
             self.images = self.open_chest_images
             self.opened = True
-            self.last_flash_time = pg.time.get_ticks()
+            self.last_flash_time = get_ticks()
+
+    def restore_opened(self):
+        # looted before its room was rebuilt, shown open without flashing or paying out again
+        self.open()
+        self.cur_frame = len(self.images) - 1
+        self.adjust_image()
+        self.added_visual = True
+        self.flash_count = self.max_flash_count
 
 
 class Trapdoor(MapTile, ActionObject):
     def __init__(self, x, y, is_dungeon_exit=False):
-        from map_generation import dungeon_tile_images
+        from map_generation import get_dungeon_tile_images
+        dungeon_tile_images = get_dungeon_tile_images()
         MapTile.__init__(self, dungeon_tile_images[39] if is_dungeon_exit else dungeon_tile_images[38], x, y)
         ActionObject.__init__(self, self.rect, self.trapdoor_action)
 
@@ -76,6 +94,9 @@ class Trapdoor(MapTile, ActionObject):
         self.opened = False
         self.is_dungeon_exit = is_dungeon_exit
 
+    def restore_opened(self):
+        self.opened = True
+
     def trapdoor_action(self, player, action_objects):
         if self.is_dungeon_exit:
             player.is_in_out_of_dungeon = True
@@ -90,21 +111,21 @@ class Trapdoor(MapTile, ActionObject):
     def update(self, player):
         word = None
         if self.opened:
-            self.image = pg.transform.scale(self.open_trapdoor_image, (WALL_SIZE, WALL_SIZE))
+            self.image = transform_cache.variant(self.open_trapdoor_image, (WALL_SIZE, WALL_SIZE))
 
             if self.is_close(player):
                 word = "Go deeper!"
         elif self.is_close(player):
                 word = "Open trapdoor!" if not self.is_dungeon_exit else "Exit dungeon!"
 
-        if word is not None:
-            text = font.render(word, True, (255, 255, 255))
-            screen.blit(text, (SCREEN_WIDTH - text.get_width() - 15, 170))
+        if word is not None and rendering_enabled():
+            text = text_cache.render(get_font(), word, (255, 255, 255))
+            draw_queue.blit("prompts", text, (SCREEN_WIDTH - text.get_width() - 15, 170))
 
 class DungeonDoor(MapTile, ActionObject):
     def __init__(self, x, y, size):
-        from map_generation import overworld_tile_images
-        MapTile.__init__(self, overworld_tile_images[147], x, y, size)
+        from map_generation import get_overworld_tile_images, dungeon_door_image_tile_id
+        MapTile.__init__(self, get_overworld_tile_images()[dungeon_door_image_tile_id], x, y, size)
         ActionObject.__init__(self, self.rect, self.trapdoor_action)
         self.last_notification_added_time = -10000
 
@@ -112,14 +133,14 @@ class DungeonDoor(MapTile, ActionObject):
         player.is_in_out_of_dungeon = True
 
     def update(self, player, *args, **kwargs):
-        if self.is_close(player):
+        if self.is_close(player) and rendering_enabled():
             word = "Start dungeoning!1!"
-            text = font.render(word, True, (255, 255, 255))
+            text = text_cache.render(get_font(), word, (255, 255, 255))
 
-            screen.blit(text, (20, 10))
+            draw_queue.blit("prompts", text, (20, 10))
 
-        if pg.time.get_ticks() - self.last_notification_added_time > 10000:
+        if get_ticks() - self.last_notification_added_time > 10000:
             visuals.add(NotificationVisual(load_images_from_folder("assets/effects/spotted"), self.rect.move(0, -80), duration=10000, iterations=20))
-            self.last_notification_added_time = pg.time.get_ticks()
+            self.last_notification_added_time = get_ticks()
 
 
@@ -0,0 +1,824 @@
+import os
+import time
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, BrokenExecutor
+from contextlib import contextmanager
+from functools import cache
+from multiprocessing import get_all_start_methods, get_context
+
+from preload import preloader
+from rng import layout_random, population_random, seed_level
+
+room_csv_files = [["assets/rooms/room" + str(i) + "_l1.csv", "assets/rooms/room" + str(i) + "_l2.csv"] for i in range(1, 7)]
+
+preloader.declare("underworld", "csv", *[path for layers in room_csv_files for path in layers])
+
+# every room template is 16x16 tiles
+room_width = 16
+room_height = 16
+
+# endurance events play one huge level, PYGEON_MEGA_DUNGEON sets how many rooms it has
+number_of_rooms_per_level = int(os.environ.get("PYGEON_MEGA_DUNGEON") or 20)
+# bigger levels are laid out by connect_rooms_frontier
+frontier_layout_min_rooms = 200
+
+
+# sides of a room that have no neighbouring room, make_doorways closes their doorway
+CLOSED_UP = 1
+CLOSED_DOWN = 2
+CLOSED_RIGHT = 4
+CLOSED_LEFT = 8
+
+
+def freeze_tiles(tiles):
+    return memoryview(array("h", tiles)).toreadonly()
+
+
+def make_doorways(doorway_mask):
+    # (tile index, tile id) writes that close the doorways on the masked sides
+    middle_tile = room_width // 2 - 1
+    end_tile = room_width - 1
+
+    def cell(row, col):
+        return row * room_width + col
+
+    overlay = []
+
+    # room above
+    if doorway_mask & CLOSED_UP:
+        overlay += [(cell(0, col), 78) for col in range(middle_tile - 1, middle_tile + 3)]  # dark tile
+        overlay += [(cell(1, col), 2) for col in range(middle_tile, middle_tile + 2)]  # wall tile
+
+    # room below
+    if doorway_mask & CLOSED_DOWN:
+        overlay += [(cell(end_tile, col), 78) for col in range(middle_tile - 1, middle_tile + 3)]  # dark tile
+        overlay += [(cell(end_tile - 1, col), 41) for col in range(middle_tile - 1, middle_tile + 3)]  # wall tile
+
+    # right room
+    if doorway_mask & CLOSED_RIGHT:
+        overlay += [(cell(row, end_tile), 78) for row in range(middle_tile - 1, middle_tile + 3)]  # dark tile
+        overlay += [(cell(row, end_tile - 1), 15) for row in range(middle_tile - 1, middle_tile + 3)]  # wall tile
+
+    # left room
+    if doorway_mask & CLOSED_LEFT:
+        overlay += [(cell(row, 0), 78) for row in range(middle_tile - 1, middle_tile + 3)]  # dark tile
+        overlay += [(cell(row, 1), 10) for row in range(middle_tile - 1, middle_tile + 3)]  # wall tile
+
+    return overlay
+
+
+wall_ids = [0, 1, 2, 3, 4, 5, 10, 15, 20, 25, 30, 35, 40, 41, 42, 43, 44, 45, 50, 51, 52, 53, 54, 55]
+void_tile_id = 78
+trapdoor_tile_id = 38
+exit_trapdoor_tile_id = 39
+# assets/dungeon_tileset.png is 10x10 tiles of 16 px, the ids past it have no image
+dungeon_tile_count = 100
+
+animated_tiles = {
+    74: ["assets/items_and_traps_animations/flag", 350],
+    93: ["assets/items_and_traps_animations/candlestick_1", 250],
+    95: ["assets/items_and_traps_animations/candlestick_2", 250],
+    90: ["assets/items_and_traps_animations/torch_front", 250],
+    91: ["assets/items_and_traps_animations/torch_sideways", 250],
+}
+
+# what a tile turns into when the level is built
+TILE_NONE = 0
+TILE_GROUND = 1
+TILE_WALL = 2
+TILE_VOID = 3
+TILE_DECORATION = 4
+TILE_ANIMATED = 5
+TILE_TRAPDOOR = 6
+TILE_EXIT_TRAPDOOR = 7
+TILE_FURNITURE = 8
+TILE_FURNITURE_DECORATION = 9
+TILE_DUNGEON_DOOR = 10
+
+
+def make_tile_class_table(default_class, classes, tile_count=32768):
+    # one byte for every int16 tile id, negative ids (the empty tile is -1) index the upper half. ids from
+    # tile_count on and all negative ones have no tile and are skipped like the empty tile
+    table = bytearray([default_class]) * tile_count + bytearray([TILE_NONE]) * (65536 - tile_count)
+    for tile_class, tile_ids in classes:
+        for tile_id in tile_ids:
+            table[tile_id] = tile_class
+    return bytes(table)
+
+
+def classify_tiles(table, tiles):
+    # one pass over a whole layer, table lookups never leave C
+    return bytes(map(table.__getitem__, tiles))
+
+
+dungeon_tile_classes = make_tile_class_table(TILE_GROUND, [
+    (TILE_WALL, wall_ids),
+    (TILE_VOID, [void_tile_id]),
+], dungeon_tile_count)
+decoration_tile_classes = make_tile_class_table(TILE_DECORATION, [
+    (TILE_ANIMATED, animated_tiles),
+    (TILE_TRAPDOOR, [trapdoor_tile_id]),
+    (TILE_EXIT_TRAPDOOR, [exit_trapdoor_tile_id]),
+], dungeon_tile_count)
+
+
+class RoomTemplate:
+    # layers are stored once as flat int16 arrays, every doorway combination is precomputed
+    # and shared read-only by all rooms built from the template
+    def __init__(self, structure_tiles, decoration_tiles):
+        structure = array("h", [tile_id for row in structure_tiles for tile_id in row])
+        self.decorations = freeze_tiles([tile_id for row in decoration_tiles for tile_id in row])
+        self.decoration_classes = classify_tiles(decoration_tile_classes, self.decorations)
+
+        self.doorway_layouts = []
+        for doorway_mask in range(16):
+            layout = array("h", structure)
+            for index, tile_id in make_doorways(doorway_mask):
+                layout[index] = tile_id
+            self.doorway_layouts.append(memoryview(layout).toreadonly())
+
+        self.structure_classes = [classify_tiles(dungeon_tile_classes, layout) for layout in self.doorway_layouts]
+
+        # placement indices of empty rooms, per (doorway mask, with decorations)
+        self.base_placements = {}
+
+    def layers(self, doorway_mask, with_decorations):
+        # structure tiles, their classes, decoration tiles and their classes of a room built from the template
+        if with_decorations:
+            return self.doorway_layouts[doorway_mask], self.structure_classes[doorway_mask], \
+                self.decorations, self.decoration_classes
+        return self.doorway_layouts[doorway_mask], self.structure_classes[doorway_mask], \
+            empty_decorations, empty_decoration_classes
+
+
+empty_decorations = freeze_tiles([-1] * (room_width * room_height))
+empty_decoration_classes = classify_tiles(decoration_tile_classes, empty_decorations)
+
+
+@cache
+def get_room_templates():
+    return [RoomTemplate(preloader.load_csv(structure), preloader.load_csv(decoration))
+            for structure, decoration in room_csv_files]
+
+
+# rooms are stored sparsely, (row, col) -> room id, so a level only takes memory for its rooms
+def place_room(cells, room, position):
+    cells[position] = room
+
+def is_valid_position(map_size, position):
+    x, y = position
+    return 0 <= x < map_size and 0 <= y < map_size
+
+def is_room_position_empty(cells, position):
+    return position not in cells
+
+def get_adjacent_positions(position):
+    x, y = position
+    return [(x-1, y), (x+1, y), (x, y-1), (x, y+1)]
+
+def connect_rooms(rooms):
+    map_size = (len(rooms) * 2 + 1)
+
+    cells = {}
+    start_position = (map_size // 2, map_size // 2)
+    place_room(cells, rooms[0], start_position)
+    connected_rooms = [start_position]
+    for room_index in range(1, len(rooms)):
+        placed = False
+        while not placed:
+            connecting_room = layout_random.choice(connected_rooms)
+            adjacent_positions = get_adjacent_positions(connecting_room)
+            layout_random.shuffle(adjacent_positions)
+            for adj_position in adjacent_positions:
+                if is_valid_position(map_size, adj_position) and is_room_position_empty(cells, adj_position):
+                    number_of_adjacent_rooms = count_adjacent_rooms(cells, adj_position)
+
+                    if (number_of_adjacent_rooms == 4 and layout_random.random() < 0.25) \
+                        or (number_of_adjacent_rooms == 3 and layout_random.random() < 0.5) \
+                        or (number_of_adjacent_rooms <= 2):
+                            place_room(cells, rooms[room_index], adj_position)
+                            connected_rooms.append(adj_position)
+                            placed = True
+                            break
+
+        if not placed:
+            print("Could not place room at index", room_index)
+    return RoomGraph(cells, (map_size, map_size))
+
+
+# how likely connect_rooms_frontier places a room on a frontier cell, by frontier_bucket
+frontier_weights = [1, 0.5, 0.25, 0]
+
+
+def frontier_bucket(number_of_adjacent_rooms):
+    # the same odds as connect_rooms: up to 2 surrounding rooms, 3, 4, and 5 or more
+    return max(0, min(number_of_adjacent_rooms, 5) - 2)
+
+
+def connect_rooms_frontier(rooms):
+    # for mega dungeons: the empty cells next to a placed room are kept in a frontier, bucketed by how
+    # many rooms surround them, so every room is placed in O(1) instead of retrying random rooms
+    cells = {}
+    adjacent_rooms = {}
+    frontier = [CellSet() for _ in frontier_weights]
+
+    def place(room, position):
+        place_room(cells, room, position)
+        number_of_adjacent_rooms = adjacent_rooms.pop(position, 0)
+        frontier[frontier_bucket(number_of_adjacent_rooms)].discard(position)
+
+        row, col = position
+        for d_row, d_col in side_offsets + diagonal_offsets:
+            neighbour = (row + d_row, col + d_col)
+            if neighbour in cells:
+                continue
+
+            count = adjacent_rooms.get(neighbour, 0)
+            adjacent_rooms[neighbour] = count + 1
+            # only cells sharing a side with a room can be connected to it
+            if neighbour in frontier[frontier_bucket(count)] or d_row == 0 or d_col == 0:
+                frontier[frontier_bucket(count)].discard(neighbour)
+                frontier[frontier_bucket(count + 1)].add(neighbour)
+
+    def pick():
+        weights = [len(bucket) * weight for bucket, weight in zip(frontier, frontier_weights)]
+        choice = layout_random.random() * sum(weights)
+        for bucket, weight in zip(frontier, weights):
+            if weight and choice < weight:
+                return bucket.sample(layout_random)
+            choice -= weight
+
+        # rounding, or only crowded cells left
+        for bucket in reversed(frontier):
+            if bucket:
+                return bucket.sample(layout_random)
+
+    place(rooms[0], (0, 0))
+    for room in rooms[1:]:
+        place(room, pick())
+
+    # moved so the map starts at (0, 0)
+    min_row = min(row for row, _ in cells)
+    min_col = min(col for _, col in cells)
+    max_row = max(row for row, _ in cells)
+    max_col = max(col for _, col in cells)
+    cells = {(row - min_row, col - min_col): room for (row, col), room in cells.items()}
+    return RoomGraph(cells, (max_row - min_row + 1, max_col - min_col + 1))
+
+
+# rooms next to each other share a doorway, diagonal ones are only close by
+side_offsets = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+diagonal_offsets = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
+
+
+class RoomGraph:
+    # where every room of a level is and how the rooms connect, built once for the whole level
+    def __init__(self, cells, size, start_room=1):
+        self.cells = cells
+        # (rows, cols) of the map the rooms are placed on, most of it is usually empty
+        self.size = size
+        self.start_room = start_room
+
+        # room id -> (row, col), in map order
+        self.positions = {room_id: position for position, room_id in sorted(cells.items())}
+
+        self.neighbours = {}
+        self.nearby = {}
+        for room_id, (row, col) in self.positions.items():
+            self.neighbours[room_id] = self.rooms_at(row, col, side_offsets)
+            self.nearby[room_id] = self.neighbours[room_id] + self.rooms_at(row, col, diagonal_offsets)
+
+        self.distances = self.path_distances(start_room)
+
+    def room_at(self, row, col):
+        return self.cells.get((row, col), 0)
+
+    def rooms_at(self, row, col, offsets):
+        rooms = [self.room_at(row + d_row, col + d_col) for d_row, d_col in offsets]
+        return [room_id for room_id in rooms if room_id != 0]
+
+    def path_distances(self, start_room):
+        # breadth first through the doorways, in rooms
+        distances = {start_room: 0}
+        queue = deque([start_room])
+        while queue:
+            room_id = queue.popleft()
+            for neighbour in self.neighbours[room_id]:
+                if neighbour not in distances:
+                    distances[neighbour] = distances[room_id] + 1
+                    queue.append(neighbour)
+        return distances
+
+    def nearby_rooms(self, room_id):
+        # the room itself and the (up to) 8 rooms around it
+        return [room_id] + self.nearby[room_id]
+
+    def distance(self, room_id, other_room_id):
+        # in rooms, diagonal steps count as one
+        row, col = self.positions[room_id]
+        other_row, other_col = self.positions[other_room_id]
+        return max(abs(row - other_row), abs(col - other_col))
+
+    def rooms_around(self, room_id, radius):
+        # (2 * radius + 1) rows of room ids centred on the room, 0 where there is none
+        row, col = self.positions[room_id]
+        return [[self.room_at(other_row, other_col) for other_col in range(col - radius, col + radius + 1)]
+                for other_row in range(row - radius, row + radius + 1)]
+
+
+def count_adjacent_rooms(cells, position):
+    row, col = position
+    count = 0
+    for i in range(row - 1, row + 2):
+        for j in range(col - 1, col + 2):
+            if (i != row or j != col) and (i, j) in cells:
+                count += 1
+    return count
+
+
+class RoomLayout:
+    # a placed room: the template's shared, read-only layers plus the room's own occupancy map
+    def __init__(self, room_id, template_index, doorway_mask, with_decorations, x_off, y_off):
+        template = get_room_templates()[template_index]
+
+        self.room_id = room_id
+        self.template_index = template_index
+        self.doorway_mask = doorway_mask
+        self.with_decorations = with_decorations
+        self.structure, self.structure_classes, self.decorations, self.decoration_classes = \
+            template.layers(doorway_mask, with_decorations)
+        self.occupied = bytearray(room_width * room_height)
+        self.x_off = x_off
+        self.y_off = y_off
+
+        # (object label, spawn kind, x, y, extra arguments), positions are in tiles
+        self.spawns = []
+
+        # the index of an empty room only depends on its layers, so it's built once and copied
+        base_placements = template.base_placements
+        key = (doorway_mask, with_decorations)
+        if key not in base_placements:
+            base_placements[key] = PlacementIndex(self)
+        self.placement = base_placements[key].copy(self)
+
+    def tile(self, row, col):
+        return self.structure[row * room_width + col]
+
+    def tile_class(self, row, col):
+        return self.structure_classes[row * room_width + col]
+
+    def is_floor(self, row, col):
+        return self.structure_classes[row * room_width + col] == TILE_GROUND
+
+    def is_wall(self, row, col):
+        return self.structure_classes[row * room_width + col] == TILE_WALL
+
+    def is_in_bounds(self, row, col):
+        return 0 <= row < room_height and 0 <= col < room_width
+
+    def is_free(self, row, col):
+        index = row * room_width + col
+        return self.decorations[index] == -1 and not self.occupied[index]
+
+    def is_empty_space(self, row, col):
+        return self.is_in_bounds(row, col) and self.is_floor(row, col) and self.is_free(row, col)
+
+    def occupy(self, index):
+        self.occupied[index] = 1
+        self.placement.occupy(index)
+
+    def position(self, index):
+        row, col = divmod(index, room_width)
+        return col + self.x_off, row + self.y_off
+
+    def spawn(self, index, label, kind, *args):
+        pos_x, pos_y = self.position(index)
+        self.spawns.append((label, kind, pos_x, pos_y, args))
+        self.occupy(index)
+
+
+class CellSet:
+    # cells kept in a list with their positions, so adding, removing and sampling are all O(1)
+    def __init__(self):
+        self.cells = []
+        self.positions = {}
+
+    def add(self, index):
+        if index not in self.positions:
+            self.positions[index] = len(self.cells)
+            self.cells.append(index)
+
+    def discard(self, index):
+        position = self.positions.pop(index, None)
+        if position is None:
+            return
+
+        last = self.cells.pop()
+        if last != index:
+            self.cells[position] = last
+            self.positions[last] = position
+
+    def __contains__(self, index):
+        return index in self.positions
+
+    def __len__(self):
+        return len(self.cells)
+
+    def copy(self):
+        cell_set = CellSet()
+        cell_set.cells = list(self.cells)
+        cell_set.positions = dict(self.positions)
+        return cell_set
+
+    def sample(self, rng):
+        return rng.choice(self.cells) if self.cells else None
+
+
+# (dx, dy) traps on walls can shoot in, in the order they are tried: down, left, right
+attack_directions = [(0, 1), (-1, 0), (1, 0)]
+flamethrower_range = 3
+arrow_trap_range = 6
+
+# chests are kept this many tiles away from the room edges
+chest_border = 3
+
+
+class PlacementIndex:
+    # the cells every kind of spawn can still go to, built once per room and updated as spawns are placed
+    def __init__(self, room):
+        self.room = room
+        self.free_floor = CellSet()
+        self.free_interior = CellSet()
+        self.clear_areas = CellSet()
+        self.flamethrower_walls = CellSet()
+        self.arrow_trap_walls = CellSet()
+
+        # free wall cell -> number of empty floor cells in front of it for every attack direction
+        self.free_runs = {}
+
+        for index in range(room_width * room_height):
+            row, col = divmod(index, room_width)
+            if not room.is_free(row, col):
+                continue
+
+            if room.is_floor(row, col):
+                self.free_floor.add(index)
+                if chest_border <= row < room_height - chest_border and chest_border <= col < room_width - chest_border:
+                    self.free_interior.add(index)
+            elif room.is_wall(row, col):
+                self.free_runs[index] = [self.measure_run(row, col, dx, dy) for dx, dy in attack_directions]
+                self.update_wall(index)
+
+        for index in self.free_floor.cells:
+            if self.is_clear_area(index):
+                self.clear_areas.add(index)
+
+    def copy(self, room):
+        placement = PlacementIndex.__new__(PlacementIndex)
+        placement.room = room
+        placement.free_floor = self.free_floor.copy()
+        placement.free_interior = self.free_interior.copy()
+        placement.clear_areas = self.clear_areas.copy()
+        placement.flamethrower_walls = self.flamethrower_walls.copy()
+        placement.arrow_trap_walls = self.arrow_trap_walls.copy()
+        placement.free_runs = {index: list(runs) for index, runs in self.free_runs.items()}
+        return placement
+
+    def measure_run(self, row, col, dx, dy):
+        run = 0
+        while run < arrow_trap_range and self.room.is_empty_space(row + (run + 1) * dy, col + (run + 1) * dx):
+            run += 1
+        return run
+
+    def is_clear_area(self, index):
+        # enemies need their cell and every neighbour inside the room to be free floor
+        row, col = divmod(index, room_width)
+        for neighbor_row in range(max(row - 1, 0), min(row + 2, room_height)):
+            for neighbor_col in range(max(col - 1, 0), min(col + 2, room_width)):
+                if neighbor_row * room_width + neighbor_col not in self.free_floor:
+                    return False
+        return True
+
+    def attack_direction(self, index, attack_range):
+        row, col = divmod(index, room_width)
+        middle_tile = room_width // 2 - 1
+
+        for (dx, dy), run in zip(attack_directions, self.free_runs[index]):
+            if run < attack_range:
+                continue
+
+            if attack_range == arrow_trap_range:
+                # arrow traps stay out of the doorway rows and columns
+                if row in (middle_tile, middle_tile + 1) or col in (middle_tile, middle_tile + 1):
+                    return None
+                if dx and self.room.tile(row, col) in [1, 2, 3, 4]:  # fix visual bug
+                    continue
+
+            return dx, dy
+        return None
+
+    def update_wall(self, index):
+        for cells, attack_range in [(self.flamethrower_walls, flamethrower_range), (self.arrow_trap_walls, arrow_trap_range)]:
+            if self.attack_direction(index, attack_range):
+                cells.add(index)
+            else:
+                cells.discard(index)
+
+    def occupy(self, index):
+        if index in self.free_runs:
+            del self.free_runs[index]
+            self.flamethrower_walls.discard(index)
+            self.arrow_trap_walls.discard(index)
+            return
+
+        if index not in self.free_floor:
+            return
+
+        self.free_floor.discard(index)
+        self.free_interior.discard(index)
+
+        row, col = divmod(index, room_width)
+        for neighbor_row in range(max(row - 1, 0), min(row + 2, room_height)):
+            for neighbor_col in range(max(col - 1, 0), min(col + 2, room_width)):
+                self.clear_areas.discard(neighbor_row * room_width + neighbor_col)
+
+        # walls looking across this cell now see a shorter run of free floor
+        for direction, (dx, dy) in enumerate(attack_directions):
+            for distance in range(1, arrow_trap_range + 1):
+                wall_row = row - distance * dy
+                wall_col = col - distance * dx
+                if not self.room.is_in_bounds(wall_row, wall_col):
+                    break
+
+                wall = wall_row * room_width + wall_col
+                runs = self.free_runs.get(wall)
+                if runs and runs[direction] >= distance:
+                    runs[direction] = distance - 1
+                    self.update_wall(wall)
+
+
+def find_furthest_room(room_graph):
+    # the room furthest to walk to from the start room
+    return max(room_graph.distances, key=room_graph.distances.get)
+
+
+def get_doorway_mask(i, j, room_graph):
+    def is_empty(row, col):
+        return room_graph.room_at(row, col) == 0
+
+    mask = 0
+    if is_empty(i - 1, j):
+        mask |= CLOSED_UP
+    if is_empty(i + 1, j):
+        mask |= CLOSED_DOWN
+    if is_empty(i, j + 1):
+        mask |= CLOSED_RIGHT
+    if is_empty(i, j - 1):
+        mask |= CLOSED_LEFT
+    return mask
+
+
+def generate_key(room):
+    index = room.placement.free_floor.sample(population_random)
+    if index is None:
+        return
+
+    room.spawn(index, "items", "key")
+
+
+def generate_flamethrower(room):
+    index = room.placement.flamethrower_walls.sample(population_random)
+    if index is None:
+        return
+
+    room.spawn(index, "traps", "flamethrower_trap", room.placement.attack_direction(index, flamethrower_range))
+
+
+def generate_enemy(room):
+    index = room.placement.clear_areas.sample(population_random)
+    if index is None:
+        return
+
+    enemies = ["skeleton_scythe_enemy", "skeleton_enemy"]
+    room.spawn(index, "characters", population_random.choice(enemies))
+
+
+def generate_arrow_trap(room):
+    index = room.placement.arrow_trap_walls.sample(population_random)
+    if index is None:
+        return
+
+    room.spawn(index, "traps", "arrow_trap", room.placement.attack_direction(index, arrow_trap_range))
+
+
+def generate_spike_trap(room, to_add):
+    for _ in range(to_add):
+        index = room.placement.free_floor.sample(population_random)
+        if index is None:
+            return
+
+        room.spawn(index, "traps", "spike_trap")
+
+
+def generate_chest(room, to_add=1):
+    for _ in range(to_add):
+        # generate in the middle of room (kinda)
+        index = room.placement.free_interior.sample(population_random)
+        if index is None:
+            return
+
+        room.spawn(index, "items", "chest", 10, 0)
+
+def populate_rooms(room_graph, timings):
+    # yields after every room, returns the room descriptions
+    furthest_room_id = find_furthest_room(room_graph)
+    number_of_rooms = len(room_graph.positions)
+
+    number_of_added = {
+        "chests": 0,
+    }
+
+    rooms = {}
+
+    for room_id, (i, j) in room_graph.positions.items():
+        with timings.timed("room layouts"):
+            if room_id == 1:
+                room_template_index = 0
+            else:
+                room_template_index = layout_random.randint(0, 5)
+
+            # the first template only keeps its decorations in the starting room
+            room = RoomLayout(room_id, room_template_index, get_doorway_mask(i, j, room_graph),
+                              room_id == 1 or room_template_index != 0, room_width * j, room_height * i)
+
+        with timings.timed("population"):
+            # generate key if is the furthest room
+            if room_id == furthest_room_id:
+                generate_key(room)
+
+            # generate traps and items
+            if room_id != 1:
+                for prob in [1, 0.5, 0.25]:
+                    if population_random.random() < prob:
+                        generate_enemy(room)
+
+                for prob in [0.7, 0.3, 0.15]:
+                    if population_random.random() < prob:
+                        generate_flamethrower(room)
+                for prob in [0.3, 0.15, 0.05]:
+                    if population_random.random() < prob:
+                        generate_arrow_trap(room)
+
+                generate_spike_trap(room, population_random.randint(0, 4))
+
+                if number_of_added["chests"] < 3 \
+                        or (3 <= number_of_added["chests"] <= 10 and population_random.random() < 0.3) \
+                        or (10 < number_of_added["chests"] and population_random.random() < 0.15):
+                    generate_chest(room)
+                    number_of_added["chests"] += 1
+
+        rooms[room_id] = RoomDescription(room)
+        yield len(rooms) / number_of_rooms
+
+    return rooms
+
+
+class RoomDescription:
+    # what a populated room is built from, plain data so it can be sent between processes
+    def __init__(self, room):
+        self.room_id = room.room_id
+        self.template_index = room.template_index
+        self.doorway_mask = room.doorway_mask
+        self.with_decorations = room.with_decorations
+        self.x_off = room.x_off
+        self.y_off = room.y_off
+        self.spawns = room.spawns
+
+        # what the player changed, by ("spawn", spawn index) or ("trapdoor", tile index)
+        self.states = {}
+
+
+class LevelDescription:
+    def __init__(self, seed, room_graph, rooms, timings):
+        self.seed = seed
+        self.room_graph = room_graph
+        self.rooms = rooms
+        self.timings = timings
+
+
+class PhaseTimings:
+    # milliseconds spent per build phase, summed over however many slices the phase was run in
+    def __init__(self):
+        self.phases = {}
+
+    @contextmanager
+    def timed(self, phase):
+        start = time.perf_counter()
+        yield
+        self.phases[phase] = self.phases.get(phase, 0) + (time.perf_counter() - start) * 1000
+
+    def report(self):
+        return "\n".join(str(round(ms, 1)).rjust(8) + " ms  " + phase for phase, ms in self.phases.items())
+
+
+def run_steps(steps):
+    # runs a build generator to the end and returns its result
+    while True:
+        try:
+            next(steps)
+        except StopIteration as stop:
+            return stop.value
+
+
+def scale_progress(steps, start, end):
+    # passes a build generator through, mapping its 0..1 progress into start..end
+    while True:
+        try:
+            progress = next(steps)
+        except StopIteration as stop:
+            return stop.value
+        yield start + (end - start) * progress
+
+
+def generate_level_steps(seed, number_of_rooms=None):
+    timings = PhaseTimings()
+    seed_level(seed)
+    number_of_rooms = number_of_rooms or number_of_rooms_per_level
+
+    with timings.timed("layout"):
+        rooms = [i + 1 for i in range(number_of_rooms)]
+        if number_of_rooms < frontier_layout_min_rooms:
+            room_graph = connect_rooms(rooms)
+        else:
+            room_graph = connect_rooms_frontier(rooms)
+    yield 0
+
+    rooms = yield from populate_rooms(room_graph, timings)
+    return LevelDescription(seed, room_graph, rooms, timings)
+
+
+def generate_level(seed, number_of_rooms=None):
+    return run_steps(generate_level_steps(seed, number_of_rooms))
+
+
+def init_worker():
+    # decodes still running on the parent's threads would never finish in the forked copy
+    preloader.futures.clear()
+
+
+class LevelPregenerator:
+    # generates the next level in a worker process while the current one is played
+    def __init__(self):
+        self.executor = None
+        self.futures = {}
+        self.broken = False
+
+    def prepare(self):
+        # forked workers don't import the main script again, which would open another window
+        if "fork" not in get_all_start_methods() or self.executor is not None or self.broken:
+            return
+
+        self.executor = ProcessPoolExecutor(1, mp_context=get_context("fork"), initializer=init_worker)
+        # the worker is only forked with the first task. forking before the preloader starts its threads
+        # keeps them out of the copy
+        self.executor.submit(int)
+
+    def start(self, seed):
+        self.prepare()
+        if self.executor is None:
+            return
+
+        for stale_seed in [other for other in self.futures if other != seed]:
+            self.futures.pop(stale_seed).cancel()
+
+        if seed not in self.futures:
+            try:
+                self.futures[seed] = self.executor.submit(generate_level, seed)
+            except BrokenExecutor:
+                # the worker died, the levels are generated in the game's process from now on
+                self.drop()
+
+    def drop(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.executor = None
+        self.futures.clear()
+        self.broken = True
+
+    def take(self, seed):
+        # None if the worker hasn't finished (or never started), the caller generates the level itself then
+        future = self.futures.pop(seed, None)
+        if future is not None and future.done() and future.exception() is None:
+            return future.result()
+
+        if future is not None:
+            future.cancel()
+        return None
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+
+level_pregenerator = LevelPregenerator()
@@ -1,262 +1,73 @@
-import pygame as pg
+import os
 
-from game import DungeonMap, Game
-from map_generation import room_width, room_height
-from shared import CHARACTER_SIZE, characters, items, traps, visuals, decorations, walls, \
-    ground, screen, WALL_SIZE
+from preload import preloader
 
-from characters import Enemy, Merchant, Player
-from tiles import FurnitureToBuyTile
-from utility import Visual, load_images_from_folder, ActionObject, Camera
-from items import Chest, DungeonDoor
-from traps import SpikeTrap
-from ui import display_ui
+# the startup report shows how long importing each module took
+with preloader.timed_imports():
+    import pygame as pg
 
+    from game import Game
+    from level_generation import level_pregenerator
+    from scenes import load_scene, load_map, run_scene
+    from renderer import renderer
+    from shared import get_screen, set_rendering, use_simulated_clock, advance_simulated_clock
+    from timestep import FixedTimestep, interpolation, steps_per_second
 
-def underworld_scene(game):
-    screen.fill("#25141A")
 
-    defeat_timer_seconds = 600 - (pg.time.get_ticks() - game.defeat_timer_start) // 1000
-    action_objects = []
-    for char in characters:
-        if isinstance(char, Merchant):
-            action_objects += char.items_to_sell
+def main():
+    pg.init()
+    with preloader.timed("open display"):
+        get_screen()
+    clock = pg.time.Clock()
+    # counts the frames drawn, the loop also runs frames without a step due
+    frame_clock = pg.time.Clock()
 
-    for tile in decorations:
-        if issubclass(tile.__class__, ActionObject):
-            action_objects.append(tile)
+    level_pregenerator.prepare()
+    load_scene("overworld")
+    game = Game(game_map=load_map("overworld"))
+    # the dungeon is loaded while the player walks around the overworld
+    preloader.start("underworld")
+    is_first_frame = True
 
-    for event in pg.event.get():
-        keys = pg.key.get_pressed()
-        if event.type == pg.QUIT:
-            game.running = False
-
-        if event.type == pg.KEYDOWN:
-            if keys[pg.K_e]:
-                for obj in action_objects:
-                    performed = obj.perform_action(game.player, action_objects)
-                    if performed:
-                        break
-
-            if keys[pg.K_UP] or keys[pg.K_DOWN] or keys[pg.K_RIGHT] or keys[pg.K_LEFT]:
-                direction = [0, 0]
-
-                if event.key == pg.K_UP:
-                    direction = [0, 1]
-                elif event.key == pg.K_DOWN:
-                    direction = [0, -1]
-                elif event.key == pg.K_RIGHT:
-                    direction = [1, 0]
-                elif event.key == pg.K_LEFT:
-                    direction = [-1, 0]
-
-                if direction[0] or direction[1]:
-                    game.player.slash_attack(direction, 0.5)
-
-            if keys[pg.K_SPACE]:
-                game.player.dash()
-
-    arrows = []
-    [arrows.extend(trap.arrows) for trap in traps if hasattr(trap, 'arrows')]
-
-    higher_order_traps = []
-    spikes = []
-    for trap in traps:
-        if isinstance(trap, SpikeTrap):
-            spikes.append(trap)
-        else:
-            higher_order_traps.append(trap)
-
-    game_objs_grps = [ground, walls, decorations, spikes, items, characters, higher_order_traps, visuals, arrows]
-    for group in game_objs_grps:
-        for obj in group:
-            screen.blit(obj.image, (obj.rect.x - game.camera.rect.x, obj.rect.y - game.camera.rect.y))
-
-            if isinstance(obj, Merchant):
-                obj.render_items(game.camera, game.player)
-
-    x = int(game.player.damage_collider.collision_rect.centerx // WALL_SIZE // 16 - 1) * WALL_SIZE * room_width
-    y = int(game.player.damage_collider.collision_rect.centery // WALL_SIZE // 16 - 1) * WALL_SIZE * room_width
-
-    restriction_rect = pg.Rect(x, y, WALL_SIZE * room_width, WALL_SIZE * room_height)
-    game.camera.update(game.player, restriction_rect)
-
-    #print(game.player.rect.x - game.camera.rect.x, game.player.rect.y - game.camera.rect.y)
-
-    for trap in traps:
-        if game.player.damage_collider.collision_rect.colliderect(trap.rect) and trap.damage > 0:
-            if isinstance(trap, SpikeTrap) and game.player.damage_collider.collision_rect.bottom - game.player.damage_collider.collision_rect.height >= trap.rect.top:
-                continue
-
-            game.player.take_damage(trap.damage)
-            trap.already_hit = True
-
-        if hasattr(trap, 'arrows'):
-            for arrow in trap.arrows:
-                if arrow.rect.colliderect(game.player.damage_collider.collision_rect):
-                    damage_took = game.player.take_damage(1)
-                    trap.already_hit = True
-                    if damage_took:
-                        trap.arrows.remove(arrow)
-                if any(arrow.rect.colliderect(wall) for wall in walls):
-                    trap.arrows.remove(arrow)
-
-    chests = []
-    for item in items:
-        if isinstance(item, Chest):
-            chests.append(item)
-        elif item.pickable and item.rect.colliderect(game.player.damage_collider.collision_rect):
-            game.player.add_item(item)
-            item.remove(items)
-
-    for char in characters:
-        # display health bar
-        if not isinstance(char, (Player, Merchant)) and 0 <= char.health < char.full_health:
-            health_bar_length = 60
-            health_bar_height = 10
-            current_health_length = (char.health / char.full_health) * health_bar_length
-
-            pos_x = char.rect.x - (health_bar_length - char.size[0]) // 2 - game.camera.rect.x
-            pos_y = char.rect.y - 14 - health_bar_height // 2 - game.camera.rect.y
-
-            pg.draw.rect(screen, (0, 0, 0), (pos_x, pos_y, health_bar_length, health_bar_height))
-            pg.draw.rect(screen, (255, 0, 0), (pos_x, pos_y, current_health_length, health_bar_height))
-
-        for attack in char.attacks:
-            dest = attack['dest']
-            effect = pg.Surface(attack['dim'])
-            dmg = attack['damage']
-
-            attack_rect = effect.get_rect()
-            attack_rect.centerx = dest[0]
-            attack_rect.centery = dest[1]
-
-            if char == game.player:
-                for chest in chests:
-                    if chest.rect.colliderect(attack_rect):
-                        chest.open()
-
-            for tested_char in characters:
-                if attack_rect.colliderect(tested_char.damage_collider.collision_rect) and tested_char != char:
-                    if tested_char == game.player:
-                        game.player.take_damage(1, char)
-                        char.handle_player_hit(game.player)
-                    else:
-                        tested_char.take_damage(dmg, game.player)
-
-                        if isinstance(tested_char, Enemy) and tested_char.health <= 0:
-                            tested_char.make_dead()
-
-            char.attacks.remove(attack)
-            images = load_images_from_folder("assets/effects/slash_attack")
-            attack_visual = Visual(images, attack_rect, attack['start_time'], attack['duration'], attack['flipped_x'], attack['flipped_y'])
-
-            visuals.add(attack_visual)
-
-    display_ui(game.player.coins, game.player.health, game.map.discovered_mini_map, game.map.current_map_cell, game.player.number_of_keys, defeat_timer_seconds, fps)
+    # game timers follow the steps, not the wall clock
+    use_simulated_clock(pg.time.get_ticks())
+    timestep = FixedTimestep()
+    frame_ms = 1000 / steps_per_second
 
-    visuals.update(game.camera)
-    decorations.update(game.player)
-    traps.update(game.player)
-    items.update(game.player)
-    characters.update(game.camera, game.player.damage_collider.collision_rect)
-    current_room_changed = game.map.update(game.player)
+    while game.running:
+        fps = round(frame_clock.get_fps())
 
-    if current_room_changed:
-        game.render_appropriate_room(game.map.current_map_cell, game.map.room_map)
-
-    if game.player.is_next_level:
-        game.player.is_next_level = False
-        generate_new_level(game.player, "underworld")
-
-    if game.player.is_in_out_of_dungeon:
-        game.player.is_in_out_of_dungeon = False
-        generate_new_level(game.player, "overworld")
-
-
-def overworld_scene(game):
-    screen.fill((0, 0, 0))
-
-    action_objects = []
-    for wall in walls:
-        if isinstance(wall, DungeonDoor) or (isinstance(wall, FurnitureToBuyTile) and not wall.bought):
-            #wall.update(game.player, game.camera)
-            action_objects.append(wall)
-
-    for decoration in decorations:
-        if (isinstance(decoration, FurnitureToBuyTile) and not decoration.bought):
-            #decoration.update(game.player, game.camera)
-            action_objects.append(decoration)
-
-    for event in pg.event.get():
         keys = pg.key.get_pressed()
-        if event.type == pg.QUIT:
-            game.running = False
-
-        if event.type == pg.KEYDOWN:
-            if keys[pg.K_e]:
-                for obj in action_objects:
-                    performed = obj.perform_action(game.player, action_objects)
-                    if performed:
-                        break
-
-    game_objs_grps = [ground, walls, items, characters, decorations, visuals]
-    for group in game_objs_grps:
-        for obj in group:
-            screen.blit(obj.image, (obj.rect.x - game.camera.rect.x, obj.rect.y - game.camera.rect.y))
-
-    game.camera.update(game.player)
-
-    walls.update(game.player, game.camera)
-    visuals.update(game.camera)
-    decorations.update(game.player, game.camera)
-    traps.update(game.player)
-    items.update(game.player)
-    characters.update(game.camera, game.player.damage_collider.collision_rect)
-
-    display_ui(game.player.coins, None, None, None, None, None, fps)
-
-
-    if game.player.is_in_out_of_dungeon:
-        game.player.is_in_out_of_dungeon = False
-        generate_new_level(game.player, "underworld")
-
-pg.init()
-clock = pg.time.Clock()
-game = Game()
-
-
-def generate_new_level(current_player, scene):
-    global game
-
-    game.clear_groups()
-
-    if not current_player:
-        characters.empty()
-    else:
-        characters.remove([char for char in characters.sprites() if not isinstance(char, Player)])
-
-    print(current_player)
-
-    game = Game(current_player, scene)
-
-
-while game.running:
-    fps = round(clock.get_fps())
-
-    keys = pg.key.get_pressed()
-
-    dx = 1 if keys[pg.K_d] else -1 if keys[pg.K_a] else 0
-    dy = 1 if keys[pg.K_w] else -1 if keys[pg.K_s] else 0
-
-    game.player.move_player(dx, -dy)
-
-    if game.scene == "underworld":
-        underworld_scene(game)
-    elif game.scene == "overworld":
-        overworld_scene(game)
-
-    pg.display.flip()
-    clock.tick(60)
 
-pg.quit()
+        dx = 1 if keys[pg.K_d] else -1 if keys[pg.K_a] else 0
+        dy = 1 if keys[pg.K_w] else -1 if keys[pg.K_s] else 0
+
+        # the frame is drawn by the last of the steps it is worth, the others only catch the game up
+        steps = timestep.advance(frame_ms)
+        interpolation.alpha = timestep.alpha()
+        events = pg.event.get() if steps else []
+        for step in range(steps):
+            if not game.running:
+                break
+            advance_simulated_clock(timestep.next_step_ms())
+            set_rendering(step == steps - 1)
+            game.player.move_player(dx, -dy)
+            game = run_scene(game, events if step == 0 else [], fps)
+
+        if steps:
+            renderer.present()
+            frame_clock.tick()
+        # looping twice as often as steps are due keeps a frame that has no step yet from waiting long
+        frame_ms = clock.tick(steps_per_second * 2)
+
+        if is_first_frame:
+            is_first_frame = False
+            if os.environ.get("PYGEON_STARTUP_REPORT"):
+                print(preloader.report())
+
+    level_pregenerator.shutdown()
+    pg.quit()
+
+
+if __name__ == "__main__":
+    main()
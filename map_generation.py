@@ -1,472 +1,395 @@
-import random
-from copy import deepcopy, copy
+from array import array
+from functools import cache
 
-from characters import SkeletonScytheEnemy, SkeletonEnemy
-from tiles import MapTile, AnimatedMapTile, FurnitureToBuyTile, furniture_groups
-from shared import WALL_SIZE, decorations, items, traps, ground, walls
+import pygame as pg
+
+from characters import SkeletonScytheEnemy, SkeletonEnemy, Enemy
+from tiles import AnimatedMapTile, BakedLayer, FurnitureToBuyTile, furniture_groups
+from shared import WALL_SIZE, wall_grid
+from collision import wall_mask
 from utility import convert_csv_to_2d_list, load_tileset
 from items import Key, Chest, Trapdoor, DungeonDoor
 from traps import FlamethrowerTrap, ArrowTrap, SpikeTrap
+from preload import preloader
+from asset_cache import SurfaceCache, transform_cache
+from rng import room_build_streams
+from level_generation import room_width, room_height, animated_tiles, get_room_templates, make_tile_class_table, \
+    classify_tiles, run_steps, PhaseTimings, TILE_NONE, TILE_GROUND, TILE_WALL, TILE_ANIMATED, TILE_TRAPDOOR, TILE_EXIT_TRAPDOOR, \
+    TILE_FURNITURE, TILE_FURNITURE_DECORATION, TILE_DUNGEON_DOOR
+
+overworld_csv_files = ["assets/rooms/overworld/main_" + str(i) + ".csv" for i in range(1, 5)]
+
+preloader.declare("underworld", "tileset", "assets/dungeon_tileset.png")
+preloader.declare("overworld", "csv", *overworld_csv_files)
+preloader.declare("overworld", "tileset", "assets/overworld_tileset.png")
+
 
-room_tile_maps = []
-for i in range(1, 7):
-    structure_tiles = convert_csv_to_2d_list(csv_file="assets/rooms/room" + str(i) + "_l1.csv")
-    decoration_tiles = convert_csv_to_2d_list(csv_file="assets/rooms/room" + str(i) + "_l2.csv")
-    room_tile_maps.append([structure_tiles, decoration_tiles])
+@cache
+def get_overworld_tile_map_layers():
+    return [convert_csv_to_2d_list(path) for path in overworld_csv_files]
 
-overworld_tile_map_layers = []
-for i in range(1, 5):
-    overworld_tile_map_layers.append(convert_csv_to_2d_list(csv_file="assets/rooms/overworld/main_" + str(i) + ".csv"))
 
-overworld_tile_images = load_tileset("assets/overworld_tileset.png", 16, 16)
-dungeon_tile_images = load_tileset("assets/dungeon_tileset.png", 16, 16)
-room_width = len(room_tile_maps[0][0][0])
-room_height = len(room_tile_maps[0][0])
+def get_overworld_tile_images():
+    return load_tileset("assets/overworld_tileset.png", 16, 16)
 
-wall_ids = [0, 1, 2, 3, 4, 5, 10, 15, 20, 25, 30, 35, 40, 41, 42, 43, 44, 45, 50, 51, 52, 53, 54, 55]
-void_tile_id = 78
 
-# ground, walls, decorations, items, traps
+def get_dungeon_tile_images():
+    return load_tileset("assets/dungeon_tileset.png", 16, 16)
+
+
+# ground, decorations, items, traps
 objects_map = {}
-room_objects = {
-    "ground": [],
-    "walls": [],
-    "decorations": [],
-    "items": [],
-    "traps": [],
-    "characters": []
-}
+object_labels = ["ground", "decorations", "items", "traps", "characters"]
+
+
+def empty_room_objects():
+    return {label: [] for label in object_labels}
+
+
+# descriptions of the current level's rooms, objects_map only holds the rooms currently built from them
+room_descriptions = {}
+# room id -> (state key, sprite) of every built object whose state outlives the sprites
+stateful_objects = {}
+# seed of the level the descriptions belong to, the rooms' sprites are seeded from it
+room_descriptions_seed = None
+
+# static layers of rooms, by (template, doorway mask, with decorations), so identical rooms share a bake
+room_layer_cache = SurfaceCache(128 * 1024 * 1024)
+
+# rooms further than this from the player's room (in rooms, diagonals count as 1) are dematerialized
+dematerialize_distance = 2
 
 carpet_tiles = [16, 17, 18, 64, 65, 66, 112, 113, 114]
 floor_tiles = [288, 289, 336, 337, 338, 339]
 door_tiles = [264, 265, 266]
 stair_tiles = [26, 74, 122]
 table_edge_tiles = [204, 205, 206, 348, 349, 350]
-def generate_overworld():
-    for layer in overworld_tile_map_layers:
-        for row in range(len(layer)):
-            for col in range(len(layer[row])):
-
-                tile_id = layer[row][col]
-                if tile_id == -1:
-                    continue
-
-                door_tile_id = 217
-                obj = MapTile(overworld_tile_images[tile_id], col, row, WALL_SIZE - 5)
-                if tile_id == door_tile_id:
-                    walls.add(DungeonDoor(col, row, WALL_SIZE - 5))
-                if tile_id in floor_tiles + carpet_tiles + door_tiles + stair_tiles:
-                    ground.add(obj)
-                elif tile_id in table_edge_tiles:
-                    obj = FurnitureToBuyTile(overworld_tile_images[tile_id], col, row, 250, tile_id, WALL_SIZE - 5)
-                    decorations.add(obj)
-                elif tile_id in [item for sublist in furniture_groups for item in sublist]:
-                    obj = FurnitureToBuyTile(overworld_tile_images[tile_id], col, row, 250, tile_id, WALL_SIZE - 5)
-                    walls.add(obj)
-                else:
-                    walls.add(obj)
+dungeon_door_tile_id = 217
+# what DungeonDoor shows under the door tile
+dungeon_door_image_tile_id = 147
 
-    map_width_px = len(overworld_tile_map_layers[0][0]) * WALL_SIZE
-    map_height_px = len(overworld_tile_map_layers[0]) * WALL_SIZE
+# later entries win, table edges are also part of a furniture group
+overworld_tile_classes = make_tile_class_table(TILE_WALL, [
+    (TILE_FURNITURE, [tile_id for group in furniture_groups for tile_id in group]),
+    (TILE_FURNITURE_DECORATION, table_edge_tiles),
+    (TILE_GROUND, floor_tiles + carpet_tiles + door_tiles + stair_tiles),
+    (TILE_DUNGEON_DOOR, [dungeon_door_tile_id]),
+])
 
-    return map_width_px, map_height_px
 
+@cache
+def get_overworld_layer_classes():
+    # int16 like the room layers, so every id is covered by the table
+    return [classify_tiles(overworld_tile_classes, array("h", [tile_id for row in layer for tile_id in row]))
+            for layer in get_overworld_tile_map_layers()]
 
-def place_room(map, room, position):
-    x, y = position
-    map[x][y] = room
 
-def is_valid_position(map, position):
-    x, y = position
-    return 0 <= x < len(map) and 0 <= y < len(map[0])
-
-def is_room_position_empty(map, position):
-    x, y = position
-    return map[x][y] == 0
-
-def get_adjacent_positions(position):
-    x, y = position
-    return [(x-1, y), (x+1, y), (x, y-1), (x, y+1)]
-
-def connect_rooms(rooms):
-    map_size = (len(rooms) * 2 + 1)
-
-    map = [[0] * map_size for _ in range(map_size)]
-    start_position = (map_size // 2, map_size // 2)
-    place_room(map, rooms[0], start_position)
-    connected_rooms = [start_position]
-    for room_index in range(1, len(rooms)):
-        placed = False
-        while not placed:
-            connecting_room = random.choice(connected_rooms)
-            adjacent_positions = get_adjacent_positions(connecting_room)
-            random.shuffle(adjacent_positions)
-            for adj_position in adjacent_positions:
-                if is_valid_position(map, adj_position) and is_room_position_empty(map, adj_position):
-                    number_of_adjacent_rooms = count_adjacent_rooms(map, adj_position)
-
-                    if (number_of_adjacent_rooms == 4 and random.random() < 0.25) \
-                        or (number_of_adjacent_rooms == 3 and random.random() < 0.5) \
-                        or (number_of_adjacent_rooms <= 2):
-                            place_room(map, rooms[room_index], adj_position)
-                            connected_rooms.append(adj_position)
-                            placed = True
-                            break
-
-        if not placed:
-            print("Could not place room at index", room_index)
-    return map
-
-
-def count_adjacent_rooms(map, position):
-    row, col = position
-    count = 0
-    for i in range(row - 1, row + 2):
-        for j in range(col - 1, col + 2):
-            if (i != row or j != col) and map[i][j] != 0:
-                count += 1
-    return count
-
-
-def is_empty_space(layout, decorations_layout, x, y):
-    return (0 <= y < len(layout) and (0 <= x < len(layout[y])
-            and layout[y][x] not in wall_ids
-            and layout[y][x] != void_tile_id)
-            and decorations_layout[y][x] == -1)
-
-
-def find_wall_with_free_n_spaces(layout, decorations_layout, direction, x, y, n):
-    directions = {
-        'up': (0, -1),
-        'down': (0, 1),
-        'left': (-1, 0),
-        'right': (1, 0)
-    }
-
-    dx, dy = directions[direction]
-
-    if layout[y][x] in wall_ids:
-        if all(is_empty_space(layout, decorations_layout, x + i * dx, y + i * dy) for i in range(1, n + 1)):
-            return directions[direction]
-    return (0, 0)
-
-
-def find_furthest_room(room_map):
-    rows = len(room_map)
-    cols = len(room_map[0])
-
-    center_row = rows // 2
-    center_col = cols // 2
-
-    max_distance = -1
-    furthest_room = None
-
-    for i in range(rows):
-        for j in range(cols):
-            distance = abs(i - center_row) + abs(j - center_col)
-            if distance > max_distance and room_map[i][j] != 0:
-                max_distance = distance
-                furthest_room = room_map[i][j]
-
-    return furthest_room
-
-
-def make_doorways(i, j, room_map, room_layout):
-    middle_tile = room_width // 2 - 1
-    end_tile = room_width - 1
-
-    # room above
-    if room_map[i - 1][j] == 0:
-        room_layout[0][middle_tile - 1] = 78  # dark tile
-        room_layout[0][middle_tile + 2] = 78
-        room_layout[0][middle_tile] = 78
-        room_layout[0][middle_tile + 1] = 78
-        room_layout[1][middle_tile] = 2  # wall tile
-        room_layout[1][middle_tile + 1] = 2
-
-    # room below
-    if room_map[i + 1][j] == 0:
-        room_layout[end_tile][middle_tile - 1] = 78  # dark tile
-        room_layout[end_tile][middle_tile + 2] = 78
-        room_layout[end_tile][middle_tile] = 78
-        room_layout[end_tile][middle_tile + 1] = 78
-        room_layout[end_tile - 1][middle_tile] = 41  # wall tile
-        room_layout[end_tile - 1][middle_tile + 1] = 41
-        room_layout[end_tile - 1][middle_tile - 1] = 41  # wall tile
-        room_layout[end_tile - 1][middle_tile + 2] = 41
-
-    # right room
-    if room_map[i][j + 1] == 0:
-        room_layout[middle_tile - 1][end_tile] = 78  # dark tile
-        room_layout[middle_tile][end_tile] = 78
-        room_layout[middle_tile + 1][end_tile] = 78
-        room_layout[middle_tile + 2][end_tile] = 78
-
-        room_layout[middle_tile - 1][end_tile - 1] = 15  # wall tile
-        room_layout[middle_tile][end_tile - 1] = 15
-        room_layout[middle_tile + 1][end_tile - 1] = 15
-        room_layout[middle_tile + 2][end_tile - 1] = 15
+# the overworld is built and drawn in square chunks of this many tiles, only those around the camera are loaded
+overworld_chunk_size = 16
+overworld_tile_size = WALL_SIZE - 5
+# chunk (row, col) -> dungeon doors, furniture and decorations of the chunk, built the first time it is loaded.
+# the ground, the walls and the doors are drawn from the chunk's bake, furniture on top so buying still shows
+overworld_chunks = {}
+overworld_chunk_cache = SurfaceCache(64 * 1024 * 1024)
+# chunks within this many chunks of the one at the centre of the screen are loaded, diagonals count as 1
+overworld_load_distance = 1
 
-        # left room
-    if room_map[i][j - 1] == 0:
-        room_layout[middle_tile - 1][0] = 78  # dark tile
-        room_layout[middle_tile][0] = 78
-        room_layout[middle_tile + 1][0] = 78
-        room_layout[middle_tile + 2][0] = 78
+# what the player collides with, in the overworld furniture and doors too
+dungeon_wall_mask = wall_mask([TILE_WALL])
+overworld_wall_mask = wall_mask([TILE_WALL, TILE_FURNITURE, TILE_DUNGEON_DOOR])
 
-        room_layout[middle_tile - 1][1] = 10  # wall tile
-        room_layout[middle_tile][1] = 10
-        room_layout[middle_tile + 1][1] = 10
-        room_layout[middle_tile + 2][1] = 10
 
+def generate_overworld_steps(timings):
+    with timings.timed("layers"):
+        overworld_tile_map_layers = get_overworld_tile_map_layers()
+        get_overworld_tile_images()
+        get_overworld_layer_classes()
 
-def traverse_rooms_in_random_order(room_layout, decorations_layout, x_off, y_off, room_id, callback, to_add=1):
-    for i in range(to_add):
-        coordinates = [(row, col) for row in range(len(room_layout)) for col in range(len(room_layout[row]))]
-        random.shuffle(coordinates)
+    with timings.timed("walls"):
+        fill_overworld_wall_grid()
 
-        for row, col in coordinates:
-            pos_x = col + x_off
-            pos_y = row + y_off
+    overworld_chunks.clear()
+    overworld_chunk_cache.clear()
 
-            added = callback(room_layout, decorations_layout, (row, col), pos_x, pos_y, room_id)
-            if added:
-                decorations_layout[row][col] = 1000  # mark as occupied
-                break
+    map_width_px = len(overworld_tile_map_layers[0][0]) * WALL_SIZE
+    map_height_px = len(overworld_tile_map_layers[0]) * WALL_SIZE
 
-def generate_key(room_layout, decorations_layout, x_off, y_off, room_id):
-    def place_key(room_layout, decorations_layout, grid_position, pos_x, pos_y, room_id):
-        row, col = grid_position
-        room_tile_id = room_layout[row][col]
-        decorations_tile_id = decorations_layout[row][col]
+    # the player starts near the middle of the map, so those chunks are built while loading
+    start_chunks = get_overworld_chunks_around(map_width_px // 2, map_height_px // 2)
+    yield 0
 
-        if room_tile_id != void_tile_id and room_tile_id not in wall_ids and decorations_tile_id == -1:
-            key = Key(pos_x * WALL_SIZE, pos_y * WALL_SIZE)
-            #items.add(key)
-            objects_map[room_id]["items"].append(key)
+    for chunks_done, chunk in enumerate(start_chunks, 1):
+        with timings.timed("chunks"):
+            get_overworld_chunk(chunk)
+            bake_overworld_chunk(chunk)
+        yield chunks_done / len(start_chunks)
 
-            return True
-        return False
+    return map_width_px, map_height_px
 
-    traverse_rooms_in_random_order(room_layout, decorations_layout, x_off, y_off, room_id, place_key)
 
-def generate_flamethrower(room_layout, decorations_layout, x_off, y_off, room_id):
+def generate_overworld():
+    return run_steps(generate_overworld_steps(PhaseTimings()))
+
+
+def fill_overworld_wall_grid():
+    # the layers are the same size, a cell is a wall if any layer has a wall there
+    layers = get_overworld_tile_map_layers()
+    cells = bytes(len(layers[0]) * len(layers[0][0]))
+    for layer_classes in get_overworld_layer_classes():
+        cells = bytes(map(max, cells, layer_classes.translate(overworld_wall_mask)))
+    wall_grid.fill(overworld_tile_size, len(layers[0][0]), len(layers[0]), cells)
+
+
+def fill_dungeon_wall_grid(level):
+    # every room's walls, loaded or not, from the structure classes of its layout
+    rows, cols = level.room_graph.size
+    width = cols * room_width
+    cells = bytearray(width * rows * room_height)
+    for room in level.rooms.values():
+        structure_classes = get_room_templates()[room.template_index].layers(room.doorway_mask, room.with_decorations)[1]
+        room_walls = structure_classes.translate(dungeon_wall_mask)
+        for row in range(room_height):
+            start = (room.y_off + row) * width + room.x_off
+            cells[start:start + room_width] = room_walls[row * room_width:(row + 1) * room_width]
+    wall_grid.fill(WALL_SIZE, width, rows * room_height, cells)
+
+
+def get_overworld_chunks_around(x_px, y_px):
+    layer = get_overworld_tile_map_layers()[0]
+    chunk_px = overworld_chunk_size * overworld_tile_size
+    rows = (len(layer) + overworld_chunk_size - 1) // overworld_chunk_size
+    cols = (len(layer[0]) + overworld_chunk_size - 1) // overworld_chunk_size
+
+    centre_row = int(y_px // chunk_px)
+    centre_col = int(x_px // chunk_px)
+    return [(row, col)
+            for row in range(max(0, centre_row - overworld_load_distance), min(rows, centre_row + overworld_load_distance + 1))
+            for col in range(max(0, centre_col - overworld_load_distance), min(cols, centre_col + overworld_load_distance + 1))]
+
+
+def overworld_chunk_cells(chunk, layer):
+    # (row, col, index in the layer's classes) of the chunk's cells, row by row
+    chunk_row, chunk_col = chunk
+    layer_width = len(layer[0])
+    for row in range(chunk_row * overworld_chunk_size, min(len(layer), (chunk_row + 1) * overworld_chunk_size)):
+        for col in range(chunk_col * overworld_chunk_size, min(layer_width, (chunk_col + 1) * overworld_chunk_size)):
+            yield row, col, row * layer_width + col
+
+
+def get_overworld_chunk(chunk):
+    if chunk in overworld_chunks:
+        return overworld_chunks[chunk]
+
+    overworld_tile_images = get_overworld_tile_images()
+    size = overworld_tile_size
+    chunk_objects = overworld_chunks[chunk] = {"doors": [], "furniture": [], "decorations": []}
+
+    for layer, layer_classes in zip(get_overworld_tile_map_layers(), get_overworld_layer_classes()):
+        for row, col, index in overworld_chunk_cells(chunk, layer):
+            tile_class = layer_classes[index]
+            tile_id = layer[row][col]
+
+            # collisions come from the wall grid, only what the player can act on is built
+            if tile_class == TILE_FURNITURE_DECORATION:
+                chunk_objects["decorations"].append(FurnitureToBuyTile(overworld_tile_images[tile_id], col, row, 250, tile_id, size))
+            elif tile_class == TILE_FURNITURE:
+                chunk_objects["furniture"].append(FurnitureToBuyTile(overworld_tile_images[tile_id], col, row, 250, tile_id, size))
+            elif tile_class == TILE_DUNGEON_DOOR:
+                chunk_objects["doors"].append(DungeonDoor(col, row, size))
+
+    return chunk_objects
+
+
+def bake_overworld_chunk(chunk):
+    def bake():
+        overworld_tile_images = get_overworld_tile_images()
+        size = overworld_tile_size
+        layers = list(zip(get_overworld_tile_map_layers(), get_overworld_layer_classes()))
+        chunk_row, chunk_col = chunk
+
+        # in the order they used to be drawn in: every layer's ground, then every layer's walls
+        tile_images = []
+        for layer, layer_classes in layers:
+            tile_images += [(overworld_tile_images[layer[row][col]], row, col)
+                            for row, col, index in overworld_chunk_cells(chunk, layer) if layer_classes[index] == TILE_GROUND]
+        for layer, layer_classes in layers:
+            for row, col, index in overworld_chunk_cells(chunk, layer):
+                if layer_classes[index] == TILE_DUNGEON_DOOR:
+                    tile_images.append((overworld_tile_images[dungeon_door_image_tile_id], row, col))
+                if layer_classes[index] in (TILE_WALL, TILE_DUNGEON_DOOR):
+                    tile_images.append((overworld_tile_images[layer[row][col]], row, col))
+
+        image = pg.Surface((overworld_chunk_size * size, overworld_chunk_size * size), pg.SRCALPHA)
+        image.blits([(transform_cache.variant(tile_image, (size, size)),
+                      ((col - chunk_col * overworld_chunk_size) * size, (row - chunk_row * overworld_chunk_size) * size))
+                     for tile_image, row, col in tile_images], False)
+        return image
+
+    return overworld_chunk_cache.get(chunk, bake)
+
+
+# spawn kinds of a level description and the sprites they are built as
+spawn_types = {
+    "key": Key,
+    "chest": Chest,
+    "skeleton_enemy": SkeletonEnemy,
+    "skeleton_scythe_enemy": SkeletonScytheEnemy,
+    "flamethrower_trap": FlamethrowerTrap,
+    "arrow_trap": ArrowTrap,
+    "spike_trap": SpikeTrap,
+}
 
-    def place_flamethrower(room_layout, decorations_layout, grid_position, pos_x, pos_y, room_id):
-        row, col = grid_position
-        room_tile_id = room_layout[row][col]
-        decorations_tile_id = decorations_layout[row][col]
 
-        if room_tile_id in wall_ids and decorations_tile_id == -1:
-            for direction in ['down', 'left', 'right']:
-                attack_dir = find_wall_with_free_n_spaces(room_layout, decorations_layout, direction, col, row, 3)
+def build_level_steps(level, timings):
+    # sprites need surfaces, so unlike the description they are always built in the main process.
+    # only the rooms around the start are built here, yields after every room
+    global room_descriptions_seed
+    get_room_templates()
+    get_dungeon_tile_images()
 
-                if attack_dir[0] or attack_dir[1]:
-                    flamethrower = FlamethrowerTrap(pos_x * WALL_SIZE, pos_y * WALL_SIZE, attack_dir)
-                    #traps.add(flamethrower)
-                    objects_map[room_id]["traps"].append(flamethrower)
+    objects_map.clear()
+    objects_map[0] = empty_room_objects()
+    room_descriptions.clear()
+    room_descriptions.update(level.rooms)
+    room_descriptions_seed = level.seed
+    stateful_objects.clear()
 
-                    return True
-        return False
+    with timings.timed("walls"):
+        fill_dungeon_wall_grid(level)
 
-    traverse_rooms_in_random_order(room_layout, decorations_layout, x_off, y_off, room_id, place_flamethrower)
+    start_rooms = level.room_graph.nearby_rooms(1)
+    for rooms_done, room_id in enumerate(start_rooms, 1):
+        with timings.timed("sprites"):
+            materialize_room(room_id)
+        yield rooms_done / len(start_rooms)
 
-def generate_enemy(room_layout, decorations_layout, x_off, y_off, room_id):
-    def place_enemy(room_layout, decorations_layout, grid_position, pos_x, pos_y, room_id):
-        row, col = grid_position
+    rows, cols = level.room_graph.size
+    map_width_px = cols * WALL_SIZE * room_width
+    map_height_px = rows * WALL_SIZE * room_height
 
-        neighbors = [(row, col), (row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1), (row - 1, col - 1), (row + 1, col + 1), (row + 1, col - 1), (row - 1, col + 1)]
+    return map_width_px, map_height_px, objects_map
 
-        for neighbor_row, neighbor_col in neighbors:
-            if 0 <= neighbor_row < len(room_layout) and 0 <= neighbor_col < len(room_layout[0]):
-                neighbor_room_tile_id = room_layout[neighbor_row][neighbor_col]
-                neighbor_decorations_tile_id = decorations_layout[neighbor_row][neighbor_col]
 
-                if not(neighbor_room_tile_id not in wall_ids and neighbor_decorations_tile_id == -1 and neighbor_room_tile_id != void_tile_id):
-                    return False
+def build_level(level):
+    return run_steps(build_level_steps(level, level.timings))
 
-        enemies = [SkeletonScytheEnemy, SkeletonEnemy]
 
-        enemy = random.choice(enemies)((pos_x) * WALL_SIZE, (pos_y) * WALL_SIZE)
-        objects_map[room_id]["characters"].append(enemy)
+def materialize_room(room_id):
+    if room_id in objects_map:
+        return
 
-        return True
+    room = room_descriptions[room_id]
+    room_objects = objects_map[room_id] = empty_room_objects()
+    stateful_objects[room_id] = []
 
-    traverse_rooms_in_random_order(room_layout, decorations_layout, x_off, y_off, room_id, place_enemy)
+    with room_build_streams(room_descriptions_seed, room_id):
+        for spawn_index in range(len(room.spawns)):
+            build_spawn(room, spawn_index)
 
+        build_room_tiles(room, room_objects)
 
-def generate_arrow_trap(room_layout, decorations_layout, x_off, y_off, room_id):
-    def place_arrow_trap(room_layout, decorations_layout, grid_position, pos_x, pos_y, room_id):
-        row, col = grid_position
-        room_tile_id = room_layout[row][col]
-        decorations_tile_id = decorations_layout[row][col]
 
-        middle_tile = room_width // 2 - 1
+def dematerialize_room(room_id):
+    # the sprites are dropped, what the player changed is kept in the description
+    room = room_descriptions[room_id]
+    for state_key, obj in stateful_objects.pop(room_id):
+        state = get_object_state(obj)
+        if state:
+            room.states[state_key] = state
 
-        if row == middle_tile or row == middle_tile + 1 or col == middle_tile or col == middle_tile + 1:
-            return False
+    del objects_map[room_id]
 
-        if room_tile_id in wall_ids and decorations_tile_id == -1:
-            for direction in ['down', 'left', 'right']:
-                attack_dir = find_wall_with_free_n_spaces(room_layout, decorations_layout, direction, col, row, 6)
 
-                if attack_dir[0] and room_tile_id in [1, 2, 3, 4]: # fix visual bug
-                    continue
+def dematerialize_far_rooms(room_graph, room_id):
+    far_rooms = [other for other in objects_map
+                 if other != 0 and room_graph.distance(room_id, other) > dematerialize_distance]
+    for other_room_id in far_rooms:
+        dematerialize_room(other_room_id)
 
-                if attack_dir[0] or attack_dir[1]:
-                    arrow_trap = ArrowTrap(pos_x * WALL_SIZE, pos_y * WALL_SIZE, attack_dir)
-                    #traps.add(arrow_trap)
-                    objects_map[room_id]["traps"].append(arrow_trap)
-                    return True
 
-        return False
+def add_spawn(room_id, label, kind, pos_x, pos_y, *args):
+    # spawns added after generation (positions in tiles) are kept and rebuilt like the generated ones
+    room = room_descriptions[room_id]
+    room.spawns.append((label, kind, pos_x, pos_y, args))
+    if room_id in objects_map:
+        return build_spawn(room, len(room.spawns) - 1)
+    return None
 
-    traverse_rooms_in_random_order(room_layout, decorations_layout, x_off, y_off, room_id, place_arrow_trap)
 
-def generate_spike_trap(room_layout, decorations_layout, x_off, y_off, room_id, to_add):
+def get_object_state(obj):
+    if isinstance(obj, Enemy):
+        return "dead" if obj.health <= 0 else None
+    if isinstance(obj, Key):
+        return "picked_up" if obj.picked_up else None
+    if isinstance(obj, (Chest, Trapdoor)):
+        return "opened" if obj.opened else None
+    return None
 
-    def place_spike_trap(room_layout, decorations_layout, grid_position, pos_x, pos_y, room_id):
-        row, col = grid_position
-        room_tile_id = room_layout[row][col]
-        decorations_tile_id = decorations_layout[row][col]
 
-        if room_tile_id != void_tile_id and room_tile_id not in wall_ids and decorations_tile_id == -1 \
-                and room_tile_id not in []: # todo: a function that return n indexes from edges
-            spike_trap = SpikeTrap(pos_x * WALL_SIZE, pos_y * WALL_SIZE)
-            #traps.add(spike_trap)
-            objects_map[room_id]["traps"].append(spike_trap)
+def build_spawn(room, spawn_index):
+    label, kind, pos_x, pos_y, args = room.spawns[spawn_index]
+    state_key = ("spawn", spawn_index)
+    state = room.states.get(state_key)
+    if state in ("dead", "picked_up"):
+        return None
 
-            return True
-        return False
+    obj = spawn_types[kind](pos_x * WALL_SIZE, pos_y * WALL_SIZE, *args)
+    if state == "opened":
+        obj.restore_opened()
 
-    traverse_rooms_in_random_order(room_layout, decorations_layout, x_off, y_off, room_id, place_spike_trap, to_add)
+    objects_map[room.room_id][label].append(obj)
+    stateful_objects[room.room_id].append((state_key, obj))
+    return obj
 
 
-def generate_chest(room_layout, decorations_layout, x_off, y_off, room_id, to_add=1):
-    def place_chest(room_layout, decorations_layout, grid_position, pos_x, pos_y, room_id):
-        row, col = grid_position
-        room_tile_id = room_layout[row][col]
-        decorations_tile_id = decorations_layout[row][col]
+def is_static_decoration(tile_class):
+    return tile_class not in (TILE_NONE, TILE_ANIMATED, TILE_TRAPDOOR, TILE_EXIT_TRAPDOOR)
 
-        # generate in the middle of room (kinda)
-        row_border_indexes = [0, 1, 2, room_width-1, room_width-2, room_width-3]
-        col_border_indexes = [0, 1, 2, room_height-1, room_height-2, room_height-3]
-        if row in row_border_indexes or col in col_border_indexes:
-            return False
 
-        if room_tile_id != void_tile_id and room_tile_id not in wall_ids and decorations_tile_id == -1:
-            chest = Chest(pos_x * WALL_SIZE, pos_y * WALL_SIZE, 10, 0)
-            #items.add(chest)
-            objects_map[room_id]["items"].append(chest)
+def bake_room_layers(room):
+    def bake():
+        dungeon_tile_images = get_dungeon_tile_images()
+        structure, structure_classes, decoration_tiles, decoration_classes = \
+            get_room_templates()[room.template_index].layers(room.doorway_mask, room.with_decorations)
 
-            return chest
-        return None
+        tiles = [(structure[index], index) for index, tile_class in enumerate(structure_classes)
+                 if tile_class != TILE_NONE]
+        tiles += [(decoration_tiles[index], index) for index, tile_class in enumerate(decoration_classes)
+                  if is_static_decoration(tile_class)]
 
-    traverse_rooms_in_random_order(room_layout, decorations_layout, x_off, y_off, room_id, place_chest, to_add)
+        image = pg.Surface((room_width * WALL_SIZE, room_height * WALL_SIZE), pg.SRCALPHA)
+        image.blits([(transform_cache.variant(dungeon_tile_images[tile_id], (WALL_SIZE, WALL_SIZE)),
+                      ((index % room_width) * WALL_SIZE, (index // room_width) * WALL_SIZE))
+                     for tile_id, index in tiles], False)
+        return image
 
+    return room_layer_cache.get((room.template_index, room.doorway_mask, room.with_decorations), bake)
 
-def generate_map(room_map):
-    empty_decorations_layout = [[-1 for _ in range(room_height)] for _ in range(room_width)]
-    furthest_room_id = find_furthest_room(room_map)
 
-    number_of_added = {
-        "chests": 0,
-    }
+def build_room_tiles(room, room_objects):
+    _, _, decoration_tiles, decoration_classes = \
+        get_room_templates()[room.template_index].layers(room.doorway_mask, room.with_decorations)
 
-    indices = [(i, j) for i in range(len(room_map)) for j in range(len(room_map[0]))]
+    # ground, walls and static decorations are drawn from the room's bake,
+    # collisions with the walls come from the level's wall grid
+    room_objects["ground"].append(BakedLayer(bake_room_layers(room), room.x_off, room.y_off))
 
-    for i, j in indices:
-        room_id = room_map[i][j]
-        objects_map[room_id] = deepcopy(room_objects)
+    for index, tile_class in enumerate(decoration_classes):
+        if tile_class == TILE_NONE or is_static_decoration(tile_class):
+            continue
 
-        x_off = room_width * j
-        y_off = room_height * i
+        row, col = divmod(index, room_width)
+        pos_x = col + room.x_off
+        pos_y = row + room.y_off
 
-        if room_id == 0:
-            continue
-        elif room_id == 1:
-            room_layout = deepcopy(room_tile_maps[0][0])
-            decorations_layout = deepcopy(room_tile_maps[0][1])
+        if tile_class == TILE_ANIMATED:
+            path, time = animated_tiles[decoration_tiles[index]]
+            obj = AnimatedMapTile(path, pos_x, pos_y, time)
         else:
-            random_room_index = random.randint(0, 5)
-            room_layout = deepcopy(room_tile_maps[random_room_index][0])
-            if random_room_index != 0:
-                decorations_layout = deepcopy(room_tile_maps[random_room_index][1])
-            else:
-                decorations_layout = empty_decorations_layout
-
-        make_doorways(i, j, room_map, room_layout)
-
-        # generate key if is the furthest room
-        if room_id == furthest_room_id:
-            generate_key(room_layout, decorations_layout, x_off, y_off, room_id)
-
-        # generate traps and items
-        if room_id != 1:
-            for prob in [1, 0.5, 0.25]:
-                if random.random() < prob:
-                    generate_enemy(room_layout, decorations_layout, x_off, y_off, room_id)
-
-            for prob in [0.7, 0.3, 0.15]:
-                if random.random() < prob:
-                    generate_flamethrower(room_layout, decorations_layout, x_off, y_off, room_id)
-            for prob in [0.3, 0.15, 0.05]:
-                if random.random() < prob:
-                    generate_arrow_trap(room_layout, decorations_layout, x_off, y_off, room_id)
-
-            generate_spike_trap(room_layout, decorations_layout, x_off, y_off, room_id, random.randint(0, 4))
-
-            if number_of_added["chests"] < 3 \
-                    or (3 <= number_of_added["chests"] <= 10 and random.random() < 0.3) \
-                    or (10 < number_of_added["chests"] and random.random() < 0.15):
-                generate_chest(room_layout, decorations_layout, x_off, y_off, room_id)
-                number_of_added["chests"] += 1
-
-        # generate sprites
-        for row in range(len(room_layout)):
-            for col in range(len(room_layout[row])):
-                pos_x = col + x_off
-                pos_y = row + y_off
-
-                room_tile_id = room_layout[row][col]
-                decorations_tile_id = decorations_layout[row][col]
-                if not(0 <= room_tile_id < len(dungeon_tile_images)):
-                    continue
-
-                obj = MapTile(dungeon_tile_images[room_tile_id], pos_x, pos_y)
-                if room_tile_id in wall_ids:
-                    #walls.add(obj)
-                    objects_map[room_id]["walls"].append(obj)
-                else:
-                    objects_map[room_id]["ground"].append(obj)
-                    #ground.add(obj)
-
-                if not(0 <= decorations_tile_id < len(dungeon_tile_images)):
-                    continue
-
-                animations_images_data = {
-                    74: ["assets/items_and_traps_animations/flag", 350],
-                    93: ["assets/items_and_traps_animations/candlestick_1", 250],
-                    95: ["assets/items_and_traps_animations/candlestick_2", 250],
-                    90: ["assets/items_and_traps_animations/torch_front", 250],
-                    91: ["assets/items_and_traps_animations/torch_sideways", 250],
-                }
-
-                if decorations_tile_id in animations_images_data:
-                    path, time = animations_images_data[decorations_tile_id]
-                    obj = AnimatedMapTile(path, pos_x, pos_y, time)
-                elif decorations_tile_id == 38:
-                    obj = Trapdoor(pos_x, pos_y)
-                elif decorations_tile_id == 39:
-                    obj = Trapdoor(pos_x, pos_y, True)
-                else:
-                    obj = MapTile(dungeon_tile_images[decorations_tile_id], pos_x, pos_y)
-
-                objects_map[room_id]["decorations"].append(obj)
-                #decorations.add(obj)
-
-    map_width_px = len(room_map[0]) * WALL_SIZE * room_width
-    map_height_px = len(room_map) * WALL_SIZE * room_height
-
-    return map_width_px, map_height_px, objects_map
+            obj = Trapdoor(pos_x, pos_y, tile_class == TILE_EXIT_TRAPDOOR)
+            state_key = ("trapdoor", index)
+            if room.states.get(state_key) == "opened":
+                obj.restore_opened()
+            stateful_objects[room.room_id].append((state_key, obj))
 
+        room_objects["decorations"].append(obj)
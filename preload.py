@@ -0,0 +1,158 @@
+import builtins
+import csv
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import pygame as pg
+
+from baked_assets import baked_assets
+
+startup_time = time.perf_counter()
+
+# every scene also needs the assets of the scenes it depends on
+scene_dependencies = {
+    "overworld": ["common"],
+    "underworld": ["common"],
+}
+
+
+def read_csv(csv_file):
+    tile_map = []
+    with open(csv_file, "r") as f:
+        for map_row in csv.reader(f):
+            tile_map.append(list(map(int, map_row)))
+    return tile_map
+
+
+class Preloader:
+    # decodes the files a scene needs on worker threads, converting them to display surfaces
+    # is left to the main thread when they are first used
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self.executor = None
+        self.manifests = {}
+        self.futures = {}
+        # paths already handed out, the asset caches keep them from there
+        self.taken = set()
+        self.timings = []
+
+    def declare(self, scene, kind, *paths):
+        manifest = self.manifests.setdefault(scene, [])
+        for path in paths:
+            if (kind, path) not in manifest:
+                manifest.append((kind, path))
+
+    def manifest(self, scene):
+        files = []
+        for required_scene in scene_dependencies.get(scene, []) + [scene]:
+            for kind, path in self.manifests.get(required_scene, []):
+                if kind != "csv" and baked_assets.is_baked(path):
+                    continue
+
+                if kind == "folder":
+                    if not os.path.isdir(path):
+                        continue
+                    for filename in os.listdir(path):
+                        img_path = os.path.join(path, filename)
+                        if os.path.isfile(img_path):
+                            files.append(("image", img_path))
+                elif os.path.isfile(path):
+                    files.append(("csv" if kind == "csv" else "image", path))
+        return files
+
+    def start(self, scene):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="preload")
+
+        for kind, path in self.manifest(scene):
+            if path not in self.futures and path not in self.taken:
+                self.futures[path] = self.executor.submit(self.decode, kind, path)
+
+    def expire(self, scene):
+        # entering a scene drops what was decoded for other scenes and never used
+        needed = {path for _, path in self.manifest(scene)}
+        for path in [path for path in self.futures if path not in needed]:
+            self.futures.pop(path).cancel()
+
+    def decode(self, kind, path):
+        start = time.perf_counter()
+        data = read_csv(path) if kind == "csv" else pg.image.load(path)
+        self.record("decode " + path, start)
+        return data
+
+    def take(self, path):
+        # blocks only if the file is still being decoded, None if it was never scheduled
+        future = self.futures.pop(path, None)
+        if future is None:
+            return None
+        self.taken.add(path)
+
+        start = time.perf_counter()
+        data = future.result()
+        if time.perf_counter() - start > 0.001:
+            self.record("wait " + path, start)
+        return data
+
+    def load_csv(self, path):
+        tile_map = self.take(path)
+        if tile_map is None:
+            tile_map = read_csv(path)
+        return tile_map
+
+    def progress(self, scene):
+        # paths already taken or never scheduled count as done
+        paths = [path for _, path in self.manifest(scene)]
+        if not paths:
+            return 1
+        return sum(path not in self.futures or self.futures[path].done() for path in paths) / len(paths)
+
+    def is_ready(self, scene):
+        return self.progress(scene) >= 1
+
+    def record(self, label, start):
+        self.timings.append((label, (time.perf_counter() - start) * 1000))
+
+    @contextmanager
+    def timed(self, label):
+        start = time.perf_counter()
+        yield
+        self.record(label, start)
+
+    @contextmanager
+    def timed_imports(self):
+        # records how long each module imported meanwhile took to import, without the modules it imported
+        # in turn, so the report shows which module's import-time work startup waits on
+        original_import = builtins.__import__
+        nested_ms = []
+
+        def timed_import(name, *args, **kwargs):
+            if name in sys.modules:
+                return original_import(name, *args, **kwargs)
+
+            start = time.perf_counter()
+            nested_ms.append(0)
+            try:
+                return original_import(name, *args, **kwargs)
+            finally:
+                ms = (time.perf_counter() - start) * 1000
+                self.timings.append(("import " + name, ms - nested_ms.pop()))
+                if nested_ms:
+                    nested_ms[-1] += ms
+
+        builtins.__import__ = timed_import
+        try:
+            yield
+        finally:
+            builtins.__import__ = original_import
+
+    def report(self, limit=20):
+        lines = ["Startup: " + str(round((time.perf_counter() - startup_time) * 1000)) + " ms since launch"]
+        for label, ms in sorted(self.timings, key=lambda timing: -timing[1])[:limit]:
+            lines.append(str(round(ms, 1)).rjust(8) + " ms  " + label)
+        return "\n".join(lines)
+
+
+preloader = Preloader()
@@ -0,0 +1,192 @@
+import os
+
+import pygame as pg
+
+from shared import get_screen, overlay_rects, mark_overlay, SCREEN_WIDTH, SCREEN_HEIGHT
+from timestep import interpolation
+
+# above this share of the screen being dirty, redrawing everything is cheaper
+max_dirty_share = 0.5
+# what is queued over a frame is drawn layer by layer in this order, the world's sprites first
+draw_layers = ["world", "world_overlay", "prompts", "hud", "debug"]
+
+
+class DrawQueue:
+    # draw commands queued by the scenes and updates over a frame and submitted in layer order at its end.
+    # the commands of a layer keep the order they were queued in, runs of blits go to the screen in one
+    # Surface.blits call. whatever isn't one of the renderer's sprites is an overlay
+    def __init__(self):
+        self.layers = {layer: [] for layer in draw_layers}
+
+    def blit(self, layer, image, dest, overlay=True, area=None):
+        self.layers[layer].append(("blit", image, dest, area, overlay))
+
+    def blits(self, layer, blits, overlay=True):
+        self.layers[layer].extend(("blit", image, dest, None, overlay) for image, dest in blits)
+
+    def rect(self, layer, color, rect, width=0):
+        self.layers[layer].append(("rect", color, pg.Rect(rect), width))
+
+    def line(self, layer, color, start, end, width=1):
+        self.layers[layer].append(("line", color, start, end, width))
+
+    def clear(self):
+        for commands in self.layers.values():
+            commands.clear()
+
+    def flush(self):
+        screen = get_screen()
+        for layer in draw_layers:
+            blits = []
+            for command in self.layers[layer]:
+                if command[0] == "blit":
+                    blits.append(command)
+                    continue
+
+                self.submit_blits(blits)
+                blits = []
+                if command[0] == "rect":
+                    _, color, rect, width = command
+                    mark_overlay(screen.fill(color, rect) if width == 0 else pg.draw.rect(screen, color, rect, width))
+                else:
+                    _, color, start, end, width = command
+                    mark_overlay(pg.draw.line(screen, color, start, end, width))
+            self.submit_blits(blits)
+        self.clear()
+
+    def submit_blits(self, blits):
+        screen = get_screen()
+        if not any(overlay for _, _, _, _, overlay in blits):
+            screen.blits([(image, dest, area) for _, image, dest, area, _ in blits], doreturn=False)
+            return
+
+        rects = screen.blits([(image, dest, area) for _, image, dest, area, _ in blits])
+        for (_, _, _, _, overlay), rect in zip(blits, rects):
+            if overlay:
+                mark_overlay(rect)
+
+
+def merge_rects(rects):
+    # overlapping rects are joined until none overlap, so no area is redrawn twice. a union can grow over
+    # rects merged before, so it is checked against them again
+    pending = [rect.clip(get_screen().get_rect()) for rect in rects]
+    merged = []
+    while pending:
+        rect = pending.pop()
+        if not rect.width or not rect.height:
+            continue
+
+        index = rect.collidelist(merged)
+        if index == -1:
+            merged.append(rect)
+        else:
+            pending.append(rect.union(merged.pop(index)))
+    return merged
+
+
+class DirtyRectRenderer:
+    # draws a scene's sprites in order over its background. with dirty rects enabled and the camera
+    # standing still, the screen keeps the last frame and only the rects of sprites that moved, changed
+    # image, appeared or disappeared and of last frame's overlays are restored from a cached background
+    # and redrawn. whenever the camera moves, everything is redrawn
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.full_redraw = True
+        self.camera = None
+        self.camera_position = None
+        self.background_sprites = []
+        self.background = None
+        # sprite -> (image, screen rect) it was drawn with last frame
+        self.drawn = {}
+        self.dirty_rects = []
+
+    def draw(self, camera, background_color, background_sprites, layers, after_blit=None):
+        previous_overlay_rects = list(overlay_rects)
+        overlay_rects.clear()
+
+        # moving sprites and the camera are drawn between where the last two steps left them
+        camera_x, camera_y = interpolation.position(camera)
+        sprites = [(sprite, sprite.image, pg.Rect(interpolation.position(sprite), sprite.image.get_size()).move(-camera_x, -camera_y))
+                   for layer in layers for sprite in layer]
+        drawn = {sprite: (image, rect) for sprite, image, rect in sprites}
+
+        settled = self.enabled and camera is self.camera and (camera_x, camera_y) == self.camera_position \
+            and background_sprites == self.background_sprites
+        self.camera = camera
+        self.camera_position = camera_x, camera_y
+        self.background_sprites = background_sprites
+
+        dirty_rects = None
+        if settled:
+            dirty_rects = merge_rects(previous_overlay_rects + self.changed_rects(drawn))
+            if sum(rect.width * rect.height for rect in dirty_rects) > max_dirty_share * SCREEN_WIDTH * SCREEN_HEIGHT:
+                dirty_rects = None
+
+        if dirty_rects is None:
+            self.draw_everything(background_color, background_sprites, sprites, after_blit)
+        else:
+            self.draw_dirty(background_color, background_sprites, sprites, dirty_rects, after_blit)
+        self.drawn = drawn
+
+    def changed_rects(self, drawn):
+        rects = []
+        for sprite, (image, rect) in drawn.items():
+            previous = self.drawn.get(sprite)
+            if previous is None or previous[0] is not image or previous[1] != rect:
+                rects.append(rect)
+                if previous is not None:
+                    rects.append(previous[1])
+
+        rects += [rect for sprite, (_, rect) in self.drawn.items() if sprite not in drawn]
+        return rects
+
+    def draw_everything(self, background_color, background_sprites, sprites, after_blit):
+        self.full_redraw = True
+        self.background = None
+
+        screen = get_screen()
+        screen.fill(background_color)
+        screen.blits([(sprite.image, (sprite.rect.x - self.camera_position[0], sprite.rect.y - self.camera_position[1]))
+                      for sprite in background_sprites], doreturn=False)
+
+        # whatever is drawn along with a sprite is queued right after it
+        for sprite, image, rect in sprites:
+            draw_queue.blit("world", image, rect, overlay=False)
+            if after_blit:
+                after_blit(sprite)
+
+    def draw_dirty(self, background_color, background_sprites, sprites, dirty_rects, after_blit):
+        self.full_redraw = False
+        self.dirty_rects = dirty_rects
+        screen = get_screen()
+
+        # the background only changes with the camera, it is cached the first frame it stands still
+        if self.background is None:
+            self.background = pg.Surface(screen.get_size())
+            self.background.fill(background_color)
+            self.background.blits([(sprite.image, (sprite.rect.x - self.camera_position[0], sprite.rect.y - self.camera_position[1]))
+                                   for sprite in background_sprites], doreturn=False)
+
+        for dirty_rect in dirty_rects:
+            screen.blit(self.background, dirty_rect, dirty_rect)
+
+        # the parts of the sprites inside the dirty rects are queued in the same order as in draw_everything,
+        # with whatever is drawn along with a sprite right after it. the dirty rects don't overlap, so no part
+        # is drawn twice
+        for sprite, image, rect in sprites:
+            for dirty_rect in dirty_rects:
+                part = rect.clip(dirty_rect)
+                if part.width and part.height:
+                    draw_queue.blit("world", image, part.topleft, overlay=False, area=part.move(-rect.x, -rect.y))
+            if after_blit:
+                after_blit(sprite)
+
+    def present(self):
+        if self.full_redraw:
+            pg.display.flip()
+        else:
+            pg.display.update(self.dirty_rects + overlay_rects)
+
+
+draw_queue = DrawQueue()
+renderer = DirtyRectRenderer(os.environ.get("PYGEON_DIRTY_RECTS") == "1")
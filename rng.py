@@ -0,0 +1,69 @@
+import os
+import random
+from contextlib import contextmanager
+
+# separate streams, so e.g. enemy AI drawing numbers during play can't change how the next level is generated
+layout_random = random.Random()
+population_random = random.Random()
+ai_random = random.Random()
+loot_random = random.Random()
+level_seeds_random = random.Random()
+# seeds already drawn for levels that are generated ahead of time
+upcoming_level_seeds = []
+
+streams = {
+    "layout": layout_random,
+    "population": population_random,
+    "ai": ai_random,
+    "loot": loot_random,
+}
+
+
+def seed_streams(seed, names=None):
+    for name in names or streams:
+        # string seeds are hashed the same way on every run, unlike hash() of tuples
+        streams[name].seed(str(seed) + ":" + name)
+
+
+def seed_level(seed):
+    seed_streams(seed, ["layout", "population", "loot"])
+
+
+@contextmanager
+def room_build_streams(seed, room_id):
+    # sprites built from a room draw numbers too. rooms are built whenever the player comes near them, so
+    # each is seeded on its own to get the same objects whatever order the rooms are visited in. the streams
+    # are put back afterwards, play draws from them as well
+    names = ["population", "loot"]
+    states = [streams[name].getstate() for name in names]
+    seed_streams(str(seed) + ":room" + str(room_id), names)
+    try:
+        yield
+    finally:
+        for name, state in zip(names, states):
+            streams[name].setstate(state)
+
+
+def next_level_seed():
+    if upcoming_level_seeds:
+        return upcoming_level_seeds.pop(0)
+    return level_seeds_random.randrange(2 ** 32)
+
+
+def peek_level_seed():
+    if not upcoming_level_seeds:
+        upcoming_level_seeds.append(level_seeds_random.randrange(2 ** 32))
+    return upcoming_level_seeds[0]
+
+
+def seed_run(seed=None):
+    if seed is None:
+        seed = random.SystemRandom().randrange(2 ** 32)
+
+    level_seeds_random.seed(str(seed) + ":levels")
+    upcoming_level_seeds.clear()
+    seed_streams(seed, ["ai"])
+    return seed
+
+
+run_seed = seed_run(int(os.environ["PYGEON_SEED"]) if os.environ.get("PYGEON_SEED") else None)
@@ -0,0 +1,350 @@
+import os
+import time
+
+import pygame as pg
+
+from game import Game, DungeonMap, OverworldMap
+from map_generation import room_width, room_height
+from shared import CHARACTER_SIZE, characters, items, traps, visuals, decorations, wall_grid, \
+    ground, furniture, doors, WALL_SIZE, HEADLESS, get_ticks, rendering_enabled
+
+from characters import Enemy, Merchant, Player
+from tiles import FurnitureToBuyTile
+from utility import Visual, load_images_from_folder, ActionObject
+from items import Chest
+from traps import SpikeTrap
+from ui import display_ui, display_loading_screen, display_render_stats
+from culling import render_stats, view_margin
+from renderer import renderer, draw_queue
+from debug_overlay import debug_overlay
+from timestep import interpolation
+from preload import preloader
+from level_generation import run_steps
+
+
+def underworld_scene(game, events, fps):
+    render = rendering_enabled()
+
+    defeat_timer_seconds = 600 - (get_ticks() - game.defeat_timer_start) // 1000
+    action_objects = []
+    for char in characters:
+        if isinstance(char, Merchant):
+            action_objects += char.items_to_sell
+
+    for tile in decorations:
+        if issubclass(tile.__class__, ActionObject):
+            action_objects.append(tile)
+
+    for event in events:
+        if event.type == pg.QUIT:
+            game.running = False
+
+        if event.type == pg.KEYDOWN:
+            if event.key == pg.K_e:
+                for obj in action_objects:
+                    performed = obj.perform_action(game.player, action_objects)
+                    if performed:
+                        break
+
+            if event.key in (pg.K_UP, pg.K_DOWN, pg.K_RIGHT, pg.K_LEFT):
+                direction = [0, 0]
+
+                if event.key == pg.K_UP:
+                    direction = [0, 1]
+                elif event.key == pg.K_DOWN:
+                    direction = [0, -1]
+                elif event.key == pg.K_RIGHT:
+                    direction = [1, 0]
+                elif event.key == pg.K_LEFT:
+                    direction = [-1, 0]
+
+                if direction[0] or direction[1]:
+                    game.player.slash_attack(direction, 0.5)
+
+            if event.key == pg.K_SPACE:
+                game.player.dash()
+
+    arrows = []
+    [arrows.extend(trap.arrows) for trap in traps if hasattr(trap, 'arrows')]
+
+    if render:
+        # only what is on screen is drawn
+        view = game.camera.view_rect(view_margin)
+        render_stats.reset()
+
+        visible_traps = render_stats.visible(traps, view)
+        higher_order_traps = []
+        spikes = []
+        for trap in visible_traps:
+            if isinstance(trap, SpikeTrap):
+                spikes.append(trap)
+            else:
+                higher_order_traps.append(trap)
+
+        def render_merchant_items(obj):
+            if isinstance(obj, Merchant):
+                obj.render_items(game.camera, game.player)
+
+        # walls are part of the rooms' baked layers in the ground group
+        game_objs_grps = [render_stats.visible(decorations, view), spikes,
+                          render_stats.visible(items, view), render_stats.visible(characters, view), higher_order_traps,
+                          render_stats.visible(visuals, view), render_stats.visible(arrows, view)]
+        renderer.draw(game.camera, "#25141A", render_stats.visible(ground, view), game_objs_grps, render_merchant_items)
+        if debug_overlay.enabled("render_chunks"):
+            debug_overlay.render_chunks(ground, view)
+
+    x = int(game.player.damage_collider.collision_rect.centerx // WALL_SIZE // 16 - 1) * WALL_SIZE * room_width
+    y = int(game.player.damage_collider.collision_rect.centery // WALL_SIZE // 16 - 1) * WALL_SIZE * room_width
+
+    restriction_rect = pg.Rect(x, y, WALL_SIZE * room_width, WALL_SIZE * room_height)
+    game.camera.update(game.player, restriction_rect)
+
+    #print(game.player.rect.x - game.camera.rect.x, game.player.rect.y - game.camera.rect.y)
+
+    for trap in traps:
+        if game.player.damage_collider.collision_rect.colliderect(trap.rect) and trap.damage > 0:
+            if isinstance(trap, SpikeTrap) and game.player.damage_collider.collision_rect.bottom - game.player.damage_collider.collision_rect.height >= trap.rect.top:
+                continue
+
+            game.player.take_damage(trap.damage)
+            trap.already_hit = True
+
+        if hasattr(trap, 'arrows'):
+            for arrow in trap.arrows:
+                if arrow.rect.colliderect(game.player.damage_collider.collision_rect):
+                    damage_took = game.player.take_damage(1)
+                    trap.already_hit = True
+                    if damage_took:
+                        trap.arrows.remove(arrow)
+                if wall_grid.collides(arrow.rect):
+                    trap.arrows.remove(arrow)
+
+    chests = []
+    for item in items:
+        if isinstance(item, Chest):
+            chests.append(item)
+        elif item.pickable and item.rect.colliderect(game.player.damage_collider.collision_rect):
+            game.player.add_item(item)
+            item.picked_up = True
+            item.remove(items)
+
+    for char in characters:
+        # display health bar
+        if render and not isinstance(char, (Player, Merchant)) and 0 <= char.health < char.full_health:
+            health_bar_length = 60
+            health_bar_height = 10
+            current_health_length = (char.health / char.full_health) * health_bar_length
+
+            char_x, char_y = interpolation.position(char)
+            camera_x, camera_y = interpolation.position(game.camera)
+            pos_x = char_x - (health_bar_length - char.size[0]) // 2 - camera_x
+            pos_y = char_y - 14 - health_bar_height // 2 - camera_y
+
+            draw_queue.rect("world_overlay", (0, 0, 0), (pos_x, pos_y, health_bar_length, health_bar_height))
+            draw_queue.rect("world_overlay", (255, 0, 0), (pos_x, pos_y, current_health_length, health_bar_height))
+
+        for attack in char.attacks:
+            dest = attack['dest']
+            effect = pg.Surface(attack['dim'])
+            dmg = attack['damage']
+
+            attack_rect = effect.get_rect()
+            attack_rect.centerx = dest[0]
+            attack_rect.centery = dest[1]
+
+            if char == game.player:
+                for chest in chests:
+                    if chest.rect.colliderect(attack_rect):
+                        chest.open()
+
+            for tested_char in characters:
+                if attack_rect.colliderect(tested_char.damage_collider.collision_rect) and tested_char != char:
+                    if tested_char == game.player:
+                        game.player.take_damage(1, char)
+                        char.handle_player_hit(game.player)
+                    else:
+                        tested_char.take_damage(dmg, game.player)
+
+                        if isinstance(tested_char, Enemy) and tested_char.health <= 0:
+                            tested_char.make_dead()
+
+            char.attacks.remove(attack)
+            images = load_images_from_folder("assets/effects/slash_attack")
+            attack_visual = Visual(images, attack_rect, attack['start_time'], attack['duration'], attack['flipped_x'], attack['flipped_y'])
+
+            visuals.add(attack_visual)
+
+    if render:
+        display_ui(game.player.coins, game.player.health, game.map.mini_map_window(), game.map.current_map_cell, game.player.number_of_keys, defeat_timer_seconds, fps)
+        if debug_overlay.enabled("render_stats"):
+            display_render_stats(render_stats)
+
+    visuals.update()
+    decorations.update(game.player)
+    traps.update(game.player)
+    items.update(game.player)
+    characters.update(game.player.damage_collider.collision_rect)
+
+    if render:
+        debug_overlay.draw(game.camera)
+    current_room_changed = game.map.update(game.player)
+
+    if current_room_changed:
+        game.render_appropriate_room(game.map.current_map_cell)
+    else:
+        game.room_streamer.build_ahead()
+
+    if game.player.is_next_level:
+        game.player.is_next_level = False
+        return generate_new_level(game, game.player, "underworld")
+
+    if game.player.is_in_out_of_dungeon:
+        game.player.is_in_out_of_dungeon = False
+        return generate_new_level(game, game.player, "overworld")
+
+    return game
+
+
+def overworld_scene(game, events, fps):
+    render = rendering_enabled()
+
+    action_objects = list(doors)
+    for piece in furniture:
+        if not piece.bought:
+            action_objects.append(piece)
+
+    for decoration in decorations:
+        if (isinstance(decoration, FurnitureToBuyTile) and not decoration.bought):
+            #decoration.update(game.player, game.camera)
+            action_objects.append(decoration)
+
+    for event in events:
+        if event.type == pg.QUIT:
+            game.running = False
+
+        if event.type == pg.KEYDOWN:
+            if event.key == pg.K_e:
+                for obj in action_objects:
+                    performed = obj.perform_action(game.player, action_objects)
+                    if performed:
+                        break
+
+    if render:
+        view = game.camera.view_rect(view_margin)
+        render_stats.reset()
+
+        # ground holds the chunks' bakes, with the plain walls already in them
+        game_objs_grps = [render_stats.visible(group, view) for group in [furniture, items, characters, decorations, visuals]]
+        renderer.draw(game.camera, (0, 0, 0), render_stats.visible(ground, view), game_objs_grps)
+        if debug_overlay.enabled("render_chunks"):
+            debug_overlay.render_chunks(ground, view)
+
+    game.camera.update(game.player)
+    game.chunk_streamer.update(game.camera)
+
+    doors.update(game.player)
+    furniture.update(game.player)
+    visuals.update()
+    decorations.update(game.player, game.camera)
+    traps.update(game.player)
+    items.update(game.player)
+    characters.update(game.player.damage_collider.collision_rect)
+
+    if render:
+        debug_overlay.draw(game.camera)
+        display_ui(game.player.coins, None, None, None, None, None, fps)
+        if debug_overlay.enabled("render_stats"):
+            display_render_stats(render_stats)
+
+    if game.player.is_in_out_of_dungeon:
+        game.player.is_in_out_of_dungeon = False
+        return generate_new_level(game, game.player, "underworld")
+
+    return game
+
+
+def load_scene(scene):
+    # decode the scene's assets in the background while keeping the window responsive
+    preloader.expire(scene)
+    preloader.start(scene)
+    # a load started by a step that isn't drawn still shows its loading screen
+    if HEADLESS:
+        return
+
+    clock = pg.time.Clock()
+    while not preloader.is_ready(scene):
+        pg.event.pump()
+        display_loading_screen(preloader.progress(scene))
+        pg.display.flip()
+        clock.tick(60)
+
+
+# time the level build may take per frame while the loading screen is up
+level_build_budget_ms = 8
+
+
+def run_sliced(steps):
+    # runs a build generator a budget's worth of steps per frame, pumping events in between
+    if HEADLESS:
+        return run_steps(steps)
+
+    clock = pg.time.Clock()
+    progress = 0
+    while True:
+        deadline = time.perf_counter() + level_build_budget_ms / 1000
+        try:
+            while time.perf_counter() < deadline:
+                progress = next(steps)
+        except StopIteration as stop:
+            return stop.value
+
+        pg.event.pump()
+        display_loading_screen(progress)
+        pg.display.flip()
+        clock.tick(60)
+
+
+def load_map(scene):
+    game_map = DungeonMap(build=False) if scene == "underworld" else OverworldMap(build=False)
+    run_sliced(game_map.build_steps())
+
+    if os.environ.get("PYGEON_LEVEL_REPORT"):
+        print("Built", scene, "map")
+        print(game_map.timings.report())
+    return game_map
+
+
+def generate_new_level(game, current_player, scene):
+    # the loading screen replaces the frame that was being queued
+    draw_queue.clear()
+    load_scene(scene)
+
+    game.clear_groups()
+
+    if not current_player:
+        characters.empty()
+    else:
+        characters.remove([char for char in characters.sprites() if not isinstance(char, Player)])
+
+    return Game(current_player, scene, game_map=load_map(scene))
+
+
+def snapshot_moving_objects(game):
+    arrows = [arrow for trap in traps if hasattr(trap, 'arrows') for arrow in trap.arrows]
+    interpolation.snapshot([game.camera, *characters, *items, *visuals, *arrows])
+
+
+def run_scene(game, events, fps):
+    # one fixed step of the game, drawn at the start of the step if rendering is on
+    snapshot_moving_objects(game)
+    debug_overlay.handle_events(events)
+    if game.scene == "underworld":
+        game = underworld_scene(game, events, fps)
+    elif game.scene == "overworld":
+        game = overworld_scene(game, events, fps)
+
+    if rendering_enabled():
+        draw_queue.flush()
+    else:
+        draw_queue.clear()
+    return game
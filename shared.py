@@ -1,26 +1,90 @@
+import os
+from functools import cache
+
 import pygame as pg
 
+from culling import IndexedGroup
+from collision import WallGrid
+
 SCREEN_WIDTH, SCREEN_HEIGHT = 1000, 700
+
+# headless runs (CI, load tests) get an offscreen display and skip all drawing
+HEADLESS = os.environ.get("PYGEON_HEADLESS") == "1"
+if HEADLESS:
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
 pg.init()
-screen = pg.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+
+
+# the window is opened the first time something is drawn or converted to the display's format
+@cache
+def get_screen():
+    return pg.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
 
 
 CHARACTER_SIZE = 65
 WALL_SIZE = 65
 
-characters = pg.sprite.Group()
-traps = pg.sprite.Group()
-items = pg.sprite.Group()
-visuals = pg.sprite.Group()
-walls = pg.sprite.Group()
-ground = pg.sprite.Group()
-decorations = pg.sprite.Group()
+# the groups that are drawn are indexed for culling
+characters = IndexedGroup()
+traps = IndexedGroup()
+items = IndexedGroup()
+visuals = IndexedGroup()
+# the walls of the current level for collisions, they are drawn from the bakes
+wall_grid = WallGrid()
+ground = IndexedGroup()
+decorations = IndexedGroup()
+# overworld furniture that can be bought, drawn over the baked chunks
+furniture = IndexedGroup()
+# the overworld's dungeon doors, only there to be acted on, the chunks' bakes show them
+doors = pg.sprite.Group()
+
+# what was drawn straight to the screen this frame besides the sprites (HUD, prompts, debug lines),
+# the dirty rect renderer erases it again next frame
+overlay_rects = []
+
+
+def mark_overlay(rect):
+    overlay_rects.append(rect)
+    return rect
+
+
+# fonts are loaded when text is first rendered
+@cache
+def get_font():
+    return pg.font.Font("assets/retro_font.ttf", 22)
+
+
+@cache
+def get_small_font():
+    return pg.font.Font("assets/retro_font.ttf", 16)
+
+
+render_enabled = not HEADLESS
+simulated_ticks = None
+
+
+def rendering_enabled():
+    return render_enabled
+
 
-font = pg.font.Font("assets/retro_font.ttf", 22)
-font_s = pg.font.Font("assets/retro_font.ttf", 16)
+def set_rendering(enabled):
+    global render_enabled
+    render_enabled = enabled
 
 
+def get_ticks():
+    # game timers read this instead of pg.time.get_ticks() so simulations can run faster than real time
+    if simulated_ticks is None:
+        return pg.time.get_ticks()
+    return simulated_ticks
 
 
+def use_simulated_clock(start_ticks=0):
+    global simulated_ticks
+    simulated_ticks = start_ticks
 
 
+def advance_simulated_clock(ms):
+    global simulated_ticks
+    simulated_ticks += ms
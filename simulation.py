@@ -0,0 +1,66 @@
+import os
+import sys
+import time
+
+# must be set before shared is imported
+os.environ.setdefault("PYGEON_HEADLESS", "1")
+
+import pygame as pg
+
+from shared import set_rendering, use_simulated_clock, advance_simulated_clock
+from game import Game
+from scenes import run_scene
+from rng import seed_run
+
+
+def key_event(key):
+    return pg.event.Event(pg.KEYDOWN, key=key)
+
+
+class Simulation:
+    # steps the game without main.py's loop, on a simulated clock so ticks don't wait for real time
+    def __init__(self, scene="underworld", render=False, tick_ms=16, seed=None):
+        set_rendering(render)
+        use_simulated_clock()
+        seed_run(seed)
+
+        self.tick_ms = tick_ms
+        self.ticks = 0
+        self.game = Game(scene=scene, seed=seed)
+
+    def step(self, move=(0, 0), events=()):
+        advance_simulated_clock(self.tick_ms)
+
+        self.game.player.move_player(move[0], move[1])
+        self.game = run_scene(self.game, list(events), 0)
+        self.ticks += 1
+
+        return self.game
+
+    def run(self, ticks, input_source=None):
+        start = time.perf_counter()
+
+        for i in range(ticks):
+            if not self.game.running:
+                break
+            move, events = input_source(self, i) if input_source else ((0, 0), ())
+            self.step(move, events)
+
+        return self.ticks / (time.perf_counter() - start)
+
+
+def wander(simulation, tick):
+    # walks in a square and swings at whatever is in front
+    directions = [(1, 0), (0, 1), (-1, 0), (0, -1)]
+    move = directions[(tick // 60) % 4]
+    events = [key_event(pg.K_RIGHT)] if tick % 30 == 0 else []
+    return move, events
+
+
+if __name__ == "__main__":
+    ticks = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+
+    simulation = Simulation(seed=seed)
+    ticks_per_second = simulation.run(ticks, wander)
+    print(simulation.ticks, "ticks,", round(ticks_per_second), "ticks per second")
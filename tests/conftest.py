@@ -0,0 +1,8 @@
+import os
+import sys
+
+# the game loads its assets relative to the repository root and draws nothing in tests
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.environ["PYGEON_HEADLESS"] = "1"
+os.chdir(root)
+sys.path.insert(0, root)
@@ -0,0 +1,31 @@
+import pickle
+from concurrent.futures import Future
+
+from characters import Merchant
+from game import Game
+from level_generation import generate_level, level_pregenerator
+from shared import characters
+
+
+def merchant_stock(seed):
+    characters.empty()
+    Game(scene="underworld", seed=seed)
+    merchant = next(char for char in characters if isinstance(char, Merchant))
+    return [(item.item_to_sell.stat, item.item_to_sell.modifier, item.price) for item in merchant.items_to_sell]
+
+
+def test_worker_built_level_gives_the_same_merchant_stock():
+    seed = 1234
+    try:
+        built_here = merchant_stock(seed)
+
+        # what the worker hands back, while this process' streams are wherever another level left them
+        level = pickle.loads(pickle.dumps(generate_level(seed)))
+        generate_level(seed + 1)
+        future = Future()
+        future.set_result(level)
+        level_pregenerator.futures[seed] = future
+
+        assert merchant_stock(seed) == built_here
+    finally:
+        level_pregenerator.shutdown()
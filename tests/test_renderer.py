@@ -0,0 +1,19 @@
+import pygame as pg
+
+from renderer import merge_rects
+
+
+def test_merge_rects_joins_unions_that_grow_over_merged_rects():
+    # the third rect only overlaps the second, their union then overlaps the first
+    first = pg.Rect(0, 0, 10, 10)
+    second = pg.Rect(15, 0, 10, 30)
+    third = pg.Rect(5, 20, 15, 5)
+
+    for rects in ([first, second, third], [third, second, first], [second, first, third]):
+        merged = merge_rects([rect.copy() for rect in rects])
+        assert merged == [pg.Rect(0, 0, 25, 30)]
+
+
+def test_merge_rects_keeps_separate_rects_apart():
+    merged = merge_rects([pg.Rect(0, 0, 10, 10), pg.Rect(20, 20, 10, 10), pg.Rect(0, 0, 0, 10)])
+    assert sorted(map(tuple, merged)) == [(0, 0, 10, 10), (20, 20, 10, 10)]
@@ -1,7 +1,13 @@
-from shared import WALL_SIZE, walls, decorations, font_s, screen, font
+from shared import WALL_SIZE, furniture, decorations, get_font, rendering_enabled
 from utility import Animated, load_images_from_folder, ActionObject
+from asset_cache import transform_cache, text_cache
+from preload import preloader
+from renderer import draw_queue
 import pygame as pg
 
+preloader.declare("underworld", "folder", *["assets/items_and_traps_animations/" + name for name in
+                                            ["flag", "candlestick_1", "candlestick_2", "torch_front", "torch_sideways"]])
+
 
 table_ids = [204, 205, 206, 252, 253, 254, 300, 301, 302, 348, 349, 350, 396, 397, 398, 444, 445, 446, 359, 215, 263, 455] # todo: add coffe, etc
 plant1_ids = [448, 496]
@@ -27,7 +33,7 @@ furniture_groups = [table_ids, plant1_ids, plant2_ids, plant3_ids, fireplace_ids
 class MapTile(pg.sprite.Sprite):
     def __init__(self, image, x, y, size=WALL_SIZE):
         super().__init__()
-        self.image = pg.transform.scale(image, (size, size))
+        self.image = transform_cache.variant(image, (size, size))
         self.col = x
         self.row = y
         self.rect = self.image.get_rect(topleft=(x * size, y * size))
@@ -35,6 +41,17 @@ class MapTile(pg.sprite.Sprite):
     def update(self, player, *args, **kwargs):
         super().update(args, kwargs)
 
+class BakedLayer(pg.sprite.Sprite):
+    # the static tiles of a whole room or overworld chunk, drawn with a single blit
+    def __init__(self, image, x, y, size=WALL_SIZE):
+        super().__init__()
+        self.image = image
+        self.rect = self.image.get_rect(topleft=(x * size, y * size))
+
+    def update(self, player, *args, **kwargs):
+        pass
+
+
 class AnimatedMapTile(MapTile, Animated):
     def __init__(self, images_path, x, y, frame_duration, flip_x=False, flip_y=False, rotate=0, size=None):
         images = load_images_from_folder(images_path)
@@ -73,10 +90,10 @@ class FurnitureToBuyTile(MapTile, ActionObject):
             if self.tile_id in group:
                 furniture_piece_group_ids = group
 
-        for furniture in list(walls) + list(decorations):
-            if isinstance(furniture, FurnitureToBuyTile):
-                if furniture.tile_id in furniture_piece_group_ids:
-                    function_to_call(furniture, player, action_objects)
+        for piece in list(furniture) + list(decorations):
+            if isinstance(piece, FurnitureToBuyTile):
+                if piece.tile_id in furniture_piece_group_ids:
+                    function_to_call(piece, player, action_objects)
 
     def update(self, player, *args, **kwargs):
         if self.bought:
@@ -92,10 +109,11 @@ class FurnitureToBuyTile(MapTile, ActionObject):
             self.traverse_correct_group(
                 lambda furniture, player, action_objects: self.update_furniture_visibility(furniture), player,[])
 
-            word = "Buy for " + str(self.price)+ "$"
-            text = font.render(word, True, (255, 255, 255))
+            if rendering_enabled():
+                word = "Buy for " + str(self.price)+ "$"
+                text = text_cache.render(get_font(), word, (255, 255, 255))
 
-            screen.blit(text, (20, 10))
+                draw_queue.blit("prompts", text, (20, 10))
 
     def update_furniture_visibility(self, furniture):
         furniture.image = furniture.barely_visible_image
@@ -0,0 +1,61 @@
+from shared import WALL_SIZE
+
+# the game is simulated in fixed steps, however fast frames are drawn. speeds, friction and the camera's
+# smoothness are tuned per step of 1/60 s
+steps_per_second = 60
+step_ms = 1000 / steps_per_second
+# a frame runs at most this many steps, the time beyond that is dropped so a slow frame doesn't snowball
+max_catch_up_steps = 5
+# an object that moved further than this in one step was placed, not moved, and isn't interpolated
+max_interpolated_distance = WALL_SIZE * 2
+
+
+class FixedTimestep:
+    def __init__(self):
+        self.accumulator = 0
+        self.steps_done = 0
+
+    def advance(self, frame_ms):
+        # how many steps the time of the last frame is worth
+        self.accumulator += frame_ms
+        steps = min(int(self.accumulator // step_ms), max_catch_up_steps)
+        self.accumulator -= steps * step_ms
+        if steps == max_catch_up_steps:
+            self.accumulator = min(self.accumulator, step_ms)
+        return steps
+
+    def alpha(self):
+        # how far the frame is from the last step to the next one
+        return self.accumulator / step_ms
+
+    def next_step_ms(self):
+        # whole milliseconds for the game clock, adding up to step_ms on average
+        self.steps_done += 1
+        return round(self.steps_done * step_ms) - round((self.steps_done - 1) * step_ms)
+
+
+class Interpolation:
+    # where moving objects were at the start of the last two steps. a frame is drawn between them, alpha
+    # of the way from the older one, so the motion stays smooth when frames and steps don't line up
+    def __init__(self):
+        self.previous = {}
+        self.current = {}
+        self.alpha = 1
+
+    def snapshot(self, objects):
+        self.previous = self.current
+        self.current = {obj: obj.rect.topleft for obj in objects}
+
+    def position(self, obj):
+        x, y = obj.rect.topleft
+        previous = self.previous.get(obj)
+        if previous is None or self.alpha >= 1 or self.current.get(obj) != (x, y):
+            return x, y
+
+        dx, dy = x - previous[0], y - previous[1]
+        if abs(dx) > max_interpolated_distance or abs(dy) > max_interpolated_distance:
+            return x, y
+        return round(previous[0] + dx * self.alpha), round(previous[1] + dy * self.alpha)
+
+
+interpolation = Interpolation()
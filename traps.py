@@ -1,8 +1,15 @@
-import random
 import pygame as pg
 
-from shared import WALL_SIZE, visuals, CHARACTER_SIZE
-from utility import load_images_from_folder, NotificationVisual, Animated
+from shared import WALL_SIZE, visuals, CHARACTER_SIZE, get_ticks
+from utility import load_images_from_folder, NotificationVisual, Animated, load_image
+from asset_cache import transform_cache
+from preload import preloader
+from rng import population_random
+
+preloader.declare("underworld", "folder", *["assets/items_and_traps_animations/" + name for name in
+                                            ["flamethrower_front", "flamethrower_sideways", "arrow_horizontal",
+                                             "arrow_vertical", "peaks"]])
+preloader.declare("underworld", "image", "assets/arrow_horizontal.png", "assets/arrow_vertical.png")
 
 class Trap(pg.sprite.Sprite, Animated):
     def __init__(self, images_path, x, y, frame_duration, cooldown, attack_dir, size, rotate=0):
@@ -13,15 +20,15 @@ class Trap(pg.sprite.Sprite, Animated):
 
         self.attack_dir = attack_dir
         self.attack_cooldown_time = cooldown
-        self.last_attack_time = pg.time.get_ticks()
+        self.last_attack_time = get_ticks()
         self.already_hit = False
         self.damage = 0
 
     def update(self, *args, **kwargs):
-        if pg.time.get_ticks() - self.last_attack_time > self.attack_cooldown_time:
+        if get_ticks() - self.last_attack_time > self.attack_cooldown_time:
             self.animate_new_frame()
             if self.cur_frame == self.last_frame:
-                self.last_attack_time = pg.time.get_ticks()
+                self.last_attack_time = get_ticks()
                 self.already_hit = False
 
 class FlamethrowerTrap(Trap):
@@ -49,7 +56,7 @@ class FlamethrowerTrap(Trap):
         size[0] *= 0.8
         size[1] *= 0.8
 
-        super().__init__(images_path, x + x_off, y + y_off, 150, 700 + random.random() * 500, attack_dir, size, rotate)
+        super().__init__(images_path, x + x_off, y + y_off, 150, 700 + population_random.random() * 500, attack_dir, size, rotate)
 
     def update(self, *args, **kwargs):
         self.damage = 0 if (self.cur_frame in [0, self.last_frame, self.last_frame-1] or self.already_hit) else 1
@@ -75,7 +82,7 @@ class ArrowTrap(Trap):
 
         rotate = 180 if attack_dir[0] == 1 else 0
 
-        Trap.__init__(self, images_path, x, y, 30, 1700 + random.random() * 500, attack_dir, size, rotate)
+        Trap.__init__(self, images_path, x, y, 30, 1700 + population_random.random() * 500, attack_dir, size, rotate)
         self.rect = self.rect.move(14 * attack_dir[0], 0)
         self.arrows = []
 
@@ -101,8 +108,8 @@ class ArrowTrap(Trap):
                 image_path = "assets/arrow_vertical.png"
                 new_arrow.rect.x += (CHARACTER_SIZE - arrow_width) // 2 - 5
 
-            new_arrow.image = pg.transform.scale(pg.image.load(image_path), (arrow_width, arrow_height))
-            new_arrow.image = pg.transform.rotate(new_arrow.image, 180 if self.attack_dir[0] == 1 else 0)
+            new_arrow.image = transform_cache.variant(load_image(image_path), (arrow_width, arrow_height),
+                                                      rotate=180 if self.attack_dir[0] == 1 else 0)
 
             self.arrows.append(new_arrow)
             self.cur_frame = 0
@@ -117,7 +124,7 @@ class SpikeTrap(Trap):
         size = (WALL_SIZE * 0.8, WALL_SIZE * 0.8)
         images_path = "assets/items_and_traps_animations/peaks"
 
-        Trap.__init__(self, images_path, x + WALL_SIZE * 0.1, y + WALL_SIZE * 0.1, 50, 1000 + random.random() * 500, [0, 0], size)
+        Trap.__init__(self, images_path, x + WALL_SIZE * 0.1, y + WALL_SIZE * 0.1, 50, 1000 + population_random.random() * 500, [0, 0], size)
         self.spikes_up_time = 600
         self.spikes_went_up_time = None
         self.spikes_up_frame_num = 2
@@ -126,8 +133,8 @@ class SpikeTrap(Trap):
         self.damage = 1 if self.cur_frame == self.spikes_up_frame_num and not self.already_hit else 0
 
         if self.cur_frame == self.spikes_up_frame_num and not self.spikes_went_up_time:
-            self.spikes_went_up_time = pg.time.get_ticks()
+            self.spikes_went_up_time = get_ticks()
 
-        if not (self.spikes_went_up_time and pg.time.get_ticks() - self.spikes_went_up_time < self.spikes_up_time):
+        if not (self.spikes_went_up_time and get_ticks() - self.spikes_went_up_time < self.spikes_up_time):
             super().update(args, kwargs)
             self.spikes_went_up_time = None
@@ -1,21 +1,20 @@
 import math
+from functools import cache
 
-from shared import SCREEN_WIDTH, SCREEN_HEIGHT, screen
+from shared import SCREEN_WIDTH, SCREEN_HEIGHT, get_screen
 import pygame as pg
-from shared import font
-from utility import Animated, load_images_from_folder, load_tileset
+from shared import get_font, get_small_font
+from utility import Animated, load_images_from_folder, load_tileset, load_image
+from asset_cache import transform_cache, text_cache
+from preload import preloader
+from renderer import draw_queue
 
-heart_image = pg.transform.scale(pg.image.load('assets/heart.png'), (30, 28))
-coin_images = load_tileset("assets/coin.png", 13, 13)
-coin_animated = Animated(coin_images, (30, 30), 200)
-key_images = load_images_from_folder("assets/items_and_traps_animations/keys/silver_resized")
-key_animated = Animated(key_images, (30, 22), 200)
+mini_map_dir = "assets/ui/1 Sprites/Paper UI Pack/Paper UI/Plain/5 Mini Map/"
 
-mini_map_background_image = pg.image.load(
-    "assets/ui/1 Sprites/Paper UI Pack/Paper UI/Plain/5 Mini Map/darkened.png").convert_alpha()
-scale = 1.1
-mini_map_background_image = pg.transform.scale(mini_map_background_image, (
-mini_map_background_image.get_width() * scale, (mini_map_background_image.get_height() * scale)))
+preloader.declare("common", "image", "assets/heart.png", "assets/coin.png")
+preloader.declare("common", "folder", "assets/items_and_traps_animations/keys/silver_resized")
+preloader.declare("underworld", "image", *[mini_map_dir + name for name in
+                                           ["cell.png", "cell_visited.png", "cell_current.png", "cell_start.png"]])
 
 gap = 5
 screen_gap = 20
@@ -24,20 +23,32 @@ cell_width = (mini_map_size - 2 * screen_gap) // (2 * 2 + 1)
 cell_height = (mini_map_size - 2 * screen_gap) // (2 * 2 + 1)
 cells_gap = (cell_width + gap) * 5 - 7
 
-cell_image = pg.image.load("assets/ui/1 Sprites/Paper UI Pack/Paper UI/Plain/5 Mini Map/cell.png").convert_alpha()
-cell_image = pg.transform.scale(cell_image, (cell_width, cell_height))
 
-visited_cell_image = pg.image.load(
-    "assets/ui/1 Sprites/Paper UI Pack/Paper UI/Plain/5 Mini Map/cell_visited.png").convert_alpha()
-visited_cell_image = pg.transform.scale(visited_cell_image, (cell_width, cell_height))
+@cache
+def heart_image():
+    return transform_cache.variant(load_image('assets/heart.png'), (30, 28))
 
-current_cell_image = pg.image.load(
-    "assets/ui/1 Sprites/Paper UI Pack/Paper UI/Plain/5 Mini Map/cell_current.png").convert_alpha()
-current_cell_image = pg.transform.scale(current_cell_image, (cell_width, cell_height))
 
-start_cell_image = pg.image.load(
-    "assets/ui/1 Sprites/Paper UI Pack/Paper UI/Plain/5 Mini Map/cell_start.png").convert_alpha()
-start_cell_image = pg.transform.scale(start_cell_image, (cell_width, cell_height))
+@cache
+def coin_animated():
+    return Animated(load_tileset("assets/coin.png", 13, 13), (30, 30), 200)
+
+
+@cache
+def key_animated():
+    return Animated(load_images_from_folder("assets/items_and_traps_animations/keys/silver_resized"), (30, 22), 200)
+
+
+@cache
+def mini_map_background_image():
+    image = load_image(mini_map_dir + "darkened.png")
+    scale = 1.1
+    return pg.transform.scale(image, (image.get_width() * scale, (image.get_height() * scale)))
+
+
+@cache
+def cell_image(name):
+    return transform_cache.variant(load_image(mini_map_dir + name), (cell_width, cell_height))
 
 
 def trim_matrix(matrix):
@@ -63,16 +74,24 @@ def trim_matrix(matrix):
     return trimmed_matrix
 
 
-def display_health(health):
-    for i in range(health):
-        screen.blit(heart_image, (10 + i * 40, 10))
+def compose(pieces):
+    # one surface holding images that don't overlap, copied as they are so it draws the same as blitting each
+    if not pieces:
+        return None
+    bounds = pg.Rect(pieces[0][1], pieces[0][0].get_size()).unionall([pg.Rect(pos, image.get_size()) for image, pos in pieces])
+    surface = pg.Surface(bounds.size, pg.SRCALPHA)
+    for image, (x, y) in pieces:
+        surface.blit(image, (x - bounds.x, y - bounds.y), special_flags=pg.BLEND_RGBA_MAX)
+    return surface, bounds.topleft
+
 
+def render_health(health):
+    return compose([(heart_image(), (10 + i * 40, 10)) for i in range(health)])
 
-def display_coins(coins):
-    screen.blit(coin_animated.image, (10, 50))
-    text = font.render("0" * (3 - int(math.log10(coins + 1))) + str(coins), True, (255, 255, 255))
-    screen.blit(text, (50, 52))
-    coin_animated.animate_new_frame()
+
+def render_coins(coins):
+    text = text_cache.render(get_font(), "0" * (3 - int(math.log10(coins + 1))) + str(coins), (255, 255, 255))
+    return text, (50, 52)
 
 
 def display_full_map(map, current_cell):
@@ -89,8 +108,7 @@ def display_full_map(map, current_cell):
     bg_width = max(400, map_width + 100)
     bg_height = max(400, map_height + 100)
 
-    pg.draw.rect(screen, (0, 0, 0),
-                 ((SCREEN_WIDTH - bg_width) // 2, (SCREEN_HEIGHT - bg_height) // 2, bg_width, bg_width))
+    draw_queue.rect("hud", (0, 0, 0), ((SCREEN_WIDTH - bg_width) // 2, (SCREEN_HEIGHT - bg_height) // 2, bg_width, bg_width))
 
     for y, row in enumerate(map):
         for x, cell in enumerate(row):
@@ -98,34 +116,14 @@ def display_full_map(map, current_cell):
             display_y = offset_y + y * (cell_size + gap)
 
             color = (0, 0, 120) if cell == 0 else (255, 0, 0) if cell == current_cell else (0, 255, 0)
-            pg.draw.rect(screen, color, (display_x, display_y, cell_size, cell_size))
-
+            draw_queue.rect("hud", color, (display_x, display_y, cell_size, cell_size))
 
-def display_mini_map(map, current_cell):
-    cell_position = [-1, -1]
-
-    for y, row in enumerate(map):
-        for x, cell in enumerate(row):
-            if cell == current_cell:
-                cell_position = [x, y]
-                break
-
-    mini_map = [[0 for _ in range(5)] for _ in range(5)]
-
-    start_x = max(0, cell_position[0] - 2)
-    end_x = min(len(map[0]), cell_position[0] + 3)
-    start_y = max(0, cell_position[1] - 2)
-    end_y = min(len(map), cell_position[1] + 3)
-
-    center_x = 2
-    center_y = 2
-
-    for y in range(start_y, end_y):
-        for x in range(start_x, end_x):
-            mini_map[center_y - (cell_position[1] - y)][center_x - (cell_position[0] - x)] = map[y][x]
 
+def render_mini_map(mini_map, current_cell):
+    # mini_map is the 5x5 window of rooms centred on the current one
     # screen.blit(mini_map_background_image, (SCREEN_WIDTH - mini_map_background_image.get_width() - screen_gap, screen_gap, mini_map_size, mini_map_size))
 
+    pieces = []
     mini_map_width_px = 5 * (cell_width + gap)
     for y in range(5):
         for x in range(5):
@@ -134,26 +132,23 @@ def display_mini_map(map, current_cell):
             cell_value = mini_map[y][x]
             # color = (255, 0, 0) if cell_value == current_cell else (0, 255, 0) if cell_value != 0 else (0, 0, 0)
             if cell_value == current_cell:
-                screen.blit(current_cell_image, (display_x, display_y, cell_width, cell_height))
+                pieces.append((cell_image("cell_current.png"), (display_x, display_y)))
             elif cell_value == 1:
-                screen.blit(start_cell_image, (display_x, display_y, cell_width, cell_height))
+                pieces.append((cell_image("cell_start.png"), (display_x, display_y)))
             elif cell_value != 0:
-                screen.blit(visited_cell_image, (display_x, display_y, cell_width, cell_height))
+                pieces.append((cell_image("cell_visited.png"), (display_x, display_y)))
             else:
-                screen.blit(cell_image, (display_x, display_y, cell_width, cell_height))
+                pieces.append((cell_image("cell.png"), (display_x, display_y)))
             # pg.draw.rect(screen, color, (display_x, display_y, cell_width, cell_height))
+    return compose(pieces)
 
 
-def display_keys(number_of_keys):
-    screen.blit(key_animated.image, (10, 92))
-
-    text = font.render(str(number_of_keys), True, (255, 255, 255))
-    screen.blit(text, (50, 90))
+def render_keys(number_of_keys):
+    text = text_cache.render(get_font(), str(number_of_keys), (255, 255, 255))
+    return text, (50, 90)
 
-    key_animated.animate_new_frame()
 
-
-def display_timer(timer_seconds):
+def render_timer(timer_seconds):
     mini_map_size = 170
     screen_gap = 15
 
@@ -167,29 +162,84 @@ def display_timer(timer_seconds):
         text += "0"
     text += str(seconds)
 
-    text = font.render(text, True, text_color)
-    screen.blit(text, (SCREEN_WIDTH - text.get_width() - screen_gap, mini_map_size + screen_gap + text.get_height()))
+    text = text_cache.render(get_font(), text, text_color)
+    return text, (SCREEN_WIDTH - text.get_width() - screen_gap, mini_map_size + screen_gap + text.get_height())
+
+
+def render_fps(fps):
+    screen_gap = 15
+
+    text = text_cache.render(get_font(), str(fps), (0, 255, 0))
+    return text, (screen_gap, SCREEN_HEIGHT - text.get_height() - screen_gap)
 
 
-def display_fps(fps):
+def display_render_stats(render_stats):
     screen_gap = 15
 
-    text = font.render(str(fps), True, (0, 255, 0))
-    screen.blit(text, (screen_gap, SCREEN_HEIGHT - text.get_height() - screen_gap))
+    text = text_cache.render(get_small_font(), "drawn " + str(render_stats.drawn) + " skipped " + str(render_stats.skipped), (0, 255, 0))
+    draw_queue.blit("debug", text, (screen_gap, SCREEN_HEIGHT - text.get_height() - screen_gap - 30))
+
+
+class HudWidget:
+    # a part of the HUD kept as a surface and position, rendered again only when the value it shows changes
+    def __init__(self, render):
+        self.render = render
+        self.value = None
+        self.rendered = None
+
+    def get(self, *value):
+        if self.rendered is None or value != self.value:
+            self.value = value
+            self.rendered = self.render(*value)
+        return self.rendered
+
+
+hud_widgets = {
+    "health": HudWidget(render_health),
+    "coins": HudWidget(render_coins),
+    "keys": HudWidget(render_keys),
+    "timer": HudWidget(render_timer),
+    "mini_map": HudWidget(render_mini_map),
+    "fps": HudWidget(render_fps),
+}
 
 
 def display_ui(coins, health, mini_map, current_cell, number_of_keys, timer_seconds, fps):
+    # the coin and key icons are animated and queued every frame, the widgets only change with their values
+    blits = []
     if health is not None:
-        display_health(health)
+        blits.append(hud_widgets["health"].get(health))
     if coins is not None:
-        display_coins(coins)
+        blits.append((coin_animated().image, (10, 50)))
+        blits.append(hud_widgets["coins"].get(coins))
+        coin_animated().animate_new_frame()
     if number_of_keys is not None:
-        display_keys(number_of_keys)
+        blits.append((key_animated().image, (10, 92)))
+        blits.append(hud_widgets["keys"].get(number_of_keys))
+        key_animated().animate_new_frame()
     if timer_seconds is not None:
-        display_timer(timer_seconds)
+        blits.append(hud_widgets["timer"].get(timer_seconds))
     if mini_map is not None and current_cell is not None:
-        display_mini_map(mini_map, current_cell)
+        blits.append(hud_widgets["mini_map"].get(mini_map, current_cell))
         # display_full_map(mini_map, current_cell)
 
     if fps is not None:
-        display_fps(fps)
+        blits.append(hud_widgets["fps"].get(fps))
+
+    draw_queue.blits("hud", [blit for blit in blits if blit is not None])
+
+
+def display_loading_screen(progress):
+    screen = get_screen()
+    screen.fill("#25141A")
+
+    bar_width = 400
+    bar_height = 16
+    bar_x = (SCREEN_WIDTH - bar_width) // 2
+    bar_y = SCREEN_HEIGHT // 2
+
+    text = text_cache.render(get_font(), "Loading...", (255, 255, 255))
+    screen.blit(text, ((SCREEN_WIDTH - text.get_width()) // 2, bar_y - text.get_height() - 15))
+
+    pg.draw.rect(screen, (0, 0, 0), (bar_x, bar_y, bar_width, bar_height))
+    pg.draw.rect(screen, (255, 255, 255), (bar_x, bar_y, bar_width * progress, bar_height))
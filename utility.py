@@ -1,9 +1,10 @@
 import math
 
 import pygame as pg
-from shared import WALL_SIZE, CHARACTER_SIZE, screen, SCREEN_WIDTH, SCREEN_HEIGHT
-import csv
-import os
+from shared import WALL_SIZE, CHARACTER_SIZE, SCREEN_WIDTH, SCREEN_HEIGHT, get_ticks
+from asset_cache import asset_registry, transform_cache, text_cache
+from preload import preloader
+from debug_overlay import debug_overlay
 
 
 class Camera:
@@ -20,6 +21,10 @@ class Camera:
 
         self.smoothness = 0.12
 
+    def view_rect(self, margin=0):
+        # the part of the world on screen
+        return pg.Rect(self.rect.x, self.rect.y, SCREEN_WIDTH, SCREEN_HEIGHT).inflate(2 * margin, 2 * margin)
+
     def update(self, player, restriction_rect=None):
         x = player.rect.centerx - (SCREEN_WIDTH // 2)
         y = player.rect.centery - (SCREEN_HEIGHT // 2)
@@ -49,40 +54,23 @@ class Camera:
         # self.rect.x = max(restriction_rect.left, min(self.rect.x, restriction_rect.right - self.width))
         # self.rect.y = max(restriction_rect.top, min(self.rect.y, restriction_rect.bottom - self.height))
 
+def load_image(path):
+    return asset_registry.image(path)
+
 def load_images_from_folder(path):
-    images = []
-    for filename in os.listdir(path):
-        img_path = os.path.join(path, filename)
-        if os.path.isfile(img_path):
-            image = pg.image.load(img_path).convert_alpha()
-            images.append(image)
-    return images
+    return asset_registry.folder(path)
 
 def convert_csv_to_2d_list(csv_file: str):
-    tile_map = []
-    with open(csv_file, "r") as f:
-        for map_row in csv.reader(f):
-            tile_map.append(list(map(int, map_row)))
-    return tile_map
+    return preloader.load_csv(csv_file)
 
 def load_tileset(image_path, tile_width, tile_height):
-    image = pg.image.load(image_path).convert_alpha()
-    image_width, image_height = image.get_size()
-
-    tiles = []
-    for y in range(0, image_height, tile_height):
-        for x in range(0, image_width, tile_width):
-            tile = image.subsurface((x, y, tile_width, tile_height)).convert_alpha()
-            tiles.append(tile)
-
-    return tiles
+    return asset_registry.tileset(image_path, tile_width, tile_height)
 
 class Animated():
     def __init__(self, images, size, frame_duration, flipped_x=False, flipped_y=False, rotate=0):
         self.images = images
-        self.image = pg.transform.scale(images[0], size)
         self.frame_duration = frame_duration
-        self.last_frame_time = pg.time.get_ticks()
+        self.last_frame_time = get_ticks()
         self.cur_frame = 0
         self.last_frame = len(images) - 1
         self.size = size
@@ -94,17 +82,15 @@ class Animated():
         self.adjust_image()
 
     def adjust_image(self):
-        self.image = pg.transform.scale(self.images[self.cur_frame], self.size)
-        self.image = pg.transform.flip(self.image, self.flipped_x, self.flipped_y)
-        self.image = pg.transform.rotate(self.image, self.rotate)
+        self.image = transform_cache.variant(self.images[self.cur_frame], self.size, self.flipped_x, self.flipped_y, self.rotate)
 
     def animate(self):
-        self.last_frame_time = pg.time.get_ticks()
+        self.last_frame_time = get_ticks()
         self.cur_frame = (self.cur_frame + 1) % len(self.images)
         self.adjust_image()
 
     def animate_new_frame(self):
-        if pg.time.get_ticks() - self.last_frame_time > self.frame_duration:
+        if get_ticks() - self.last_frame_time > self.frame_duration:
             self.animate()
 
 
@@ -122,21 +108,18 @@ class Visual(pg.sprite.Sprite, Animated):
     def update(self, *args, **kwargs):
         self.animate_new_frame()
 
-        camera = args[0]
-
-        if camera:
-            rect = self.rect.move(-camera.rect.x, -camera.rect.y)
-            pg.draw.line(screen, (0, 0, 255), rect.topleft, rect.topright)
-            pg.draw.line(screen, (0, 0, 255), rect.bottomleft, rect.bottomright)
-            pg.draw.line(screen, (0, 0, 255), rect.topleft, rect.bottomleft)
-            pg.draw.line(screen, (0, 0, 255), rect.topright, rect.bottomright)
+        if debug_overlay.enabled("visuals"):
+            debug_overlay.rect((0, 0, 255), self.rect, self)
 
-        if pg.time.get_ticks() - self.start_time > self.duration:
+        if get_ticks() - self.start_time > self.duration:
             # remove yourself from Group
             self.kill()
 
 
 class NotificationVisual(Visual):
+    # floats up when float_in is set
+    moves = True
+
     def __init__(self, images, rect, float_in=False, duration=-1, iterations=1):
         ratio = images[0].get_width() / images[0].get_height()
 
@@ -147,7 +130,7 @@ class NotificationVisual(Visual):
             rect.height = WALL_SIZE
             rect.width = WALL_SIZE * ratio
 
-        super().__init__(images, rect, pg.time.get_ticks(), duration if duration != -1 else len(images) * 100, iterations=iterations)
+        super().__init__(images, rect, get_ticks(), duration if duration != -1 else len(images) * 100, iterations=iterations)
 
         self.float_in = float_in
         self.goal_position_y = rect.y - 20
@@ -182,6 +165,26 @@ class ActionObject:
         return False
 
 
+class TextBlock:
+    # lines of text centred over a translucent box, laid out once for tooltips that are drawn every frame
+    def __init__(self, font, lines, color=(255, 255, 255), padding=(20, 20), box_color=(0, 0, 0, 168), text_width=None):
+        self.lines = [text_cache.render(font, line, color) for line in lines]
+        self.padding = padding
+        self.text_width = text_width if text_width is not None else max(line.get_width() for line in self.lines)
+        self.text_height = len(self.lines) * font.get_height()
+
+        self.box = pg.Surface((self.text_width + padding[0], self.text_height + padding[1]), pg.SRCALPHA)
+        self.box.fill(box_color)
+        # lines are placed up from the bottom of the text by their own height, a few words render a pixel taller
+        bottom = padding[1] // 2 + self.text_height
+        self.offsets = [(self.text_width // 2 + padding[0] // 2 - line.get_width() // 2, bottom - (len(self.lines) - i) * line.get_height())
+                        for i, line in enumerate(self.lines)]
+
+    def blits(self, position):
+        x, y = position
+        return [(self.box, position)] + [(line, (x + off_x, y + off_y)) for line, (off_x, off_y) in zip(self.lines, self.offsets)]
+
+
 class Collider():
     def __init__(self, offset, collision_size, debug_color=(255, 255, 0)):
         self.offset = offset
@@ -189,14 +192,11 @@ class Collider():
         self.collision_rect = pg.Rect(0, 0, collision_size[0], collision_size[1])
         self.debug_color = debug_color
 
-    def update(self, rect, camera=None):
+    def update(self, rect, debug_owner=None):
+        # debug_owner is the sprite the collider belongs to, its box is drawn when set
         self.collision_rect = pg.Rect(rect.x + self.offset[0], rect.y + self.offset[1], self.collision_size[0], self.collision_size[1])
-        if camera:
-            rect = self.collision_rect.move(-camera.rect.x, -camera.rect.y)
-            pg.draw.line(screen, self.debug_color, rect.topleft, rect.topright)
-            pg.draw.line(screen, self.debug_color, rect.bottomleft, rect.bottomright)
-            pg.draw.line(screen, self.debug_color, rect.topleft, rect.bottomleft)
-            pg.draw.line(screen, self.debug_color, rect.topright, rect.bottomright)
+        if debug_owner is not None and debug_overlay.enabled("colliders"):
+            debug_overlay.rect(self.debug_color, self.collision_rect, debug_owner)
 
 
 